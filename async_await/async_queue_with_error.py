@@ -46,6 +46,15 @@ class AsyncQueue:
 
         return self.items.popleft()
 
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except QueueClosed:
+            raise StopAsyncIteration
+
 
 aq = AsyncQueue()
 
@@ -61,12 +70,9 @@ async def producer(q, count):
 
 
 async def consumer(q):
-    try:
-        while True:
-            item = await q.get()
-            print('Consuming', item)
-    except QueueClosed:
-        print('Consumer done')
+    async for item in q:
+        print('Consuming', item)
+    print('Consumer done')
 
 
 sched.new_task(producer(aq, 10))
@@ -89,4 +95,8 @@ sched.run()
     работает в случае пустой очереди, не доходя до строки возвращения результата(return self.items.popleft()). В этой
     новой итерации он проверят не закрыта ли очередь, если закрыта, то выбрасывает исключение QueueClosed, которое
     перехватывает потребитель.
+
+    Очередь можно перебирать циклом async for. Метод __anext__ вызывает get() и превращает исключение QueueClosed в
+    StopAsyncIteration, на котором цикл async for завершается. Поэтому потребителю не нужно самому писать цикл
+    while True и отлавливать QueueClosed.
 """
\ No newline at end of file
@@ -18,6 +18,7 @@ class Scheduler:
         self.sleeping = []
         self.current = None    # Currently executing generator
         self.sequence = 0
+        self.eager = False     # new_task() runs the coroutine right away, up to its first wait
 
     async def sleep(self, delay):
         deadline = time.time() + delay
@@ -27,7 +28,18 @@ class Scheduler:
         await switch()       # Switch tasks
 
     def new_task(self, coro):
-        self.ready.append(coro)
+        if not self.eager:
+            self.ready.append(coro)
+            return
+        current = self.current
+        self.current = coro
+        try:
+            coro.send(None)
+            if self.current:
+                self.ready.append(coro)
+        except StopIteration:
+            pass
+        self.current = current
 
     def run(self):
         while self.ready or self.sleeping:
@@ -75,4 +87,8 @@ if __name__ == '__main__':
 """
     Тоже самое, что и в файле generators/yield_from.py, только вместо операторов yield from ключевое слово await
     работает точно также. Еще добавлено ключевое слово async, обозночая генератор корутиной.
+
+    eager - если sched.eager = True, то new_task() не кладет корутину в очередь готовых, а сразу выполняет ее до первого
+    ожидания. Корутина, которая завершилась не заснув ни разу, вообще не проходит через очередь. Текущая корутина
+    (self.current) сохраняется и восстанавливается, потому что new_task() обычно вызывают из другой корутины.
 """
@@ -0,0 +1,670 @@
+import asyncio
+import concurrent.futures
+import heapq
+import socket
+import threading
+import time
+
+import protocols
+from io_scheduler import Scheduler
+
+_MIN_SCHEDULED_TIMERS = 100     # Smaller heaps aren't worth rebuilding, as in asyncio.base_events
+
+
+class _StopLoop(BaseException):
+    pass
+
+
+def _stop_loop():
+    raise _StopLoop()
+
+
+def _fileno(fd):
+    if isinstance(fd, int):
+        return fd
+    return fd.fileno()
+
+
+# asyncio handles that look like plain callbacks to the Scheduler
+class _Handle(asyncio.Handle):
+    __slots__ = ()
+
+    def __call__(self):
+        if not self._cancelled:
+            self._run()
+
+
+class _TimerHandle(asyncio.TimerHandle):
+    __slots__ = ()
+
+    def __call__(self):
+        self._scheduled = False     # Out of the heap, cancel() no longer counts it
+        if self._cancelled:
+            self._loop._timer_cancelled_count -= 1
+        else:
+            self._run()
+
+
+class _IOHandle(asyncio.Handle):
+    __slots__ = ('_fd', '_waiting')
+
+    def __init__(self, fd, waiting, callback, args, loop):
+        super().__init__(callback, args, loop)
+        self._fd = fd
+        self._waiting = waiting
+
+    def __call__(self):
+        if not self._cancelled:
+            self._run()
+            if not self._cancelled:
+                self._waiting[self._fd] = self   # asyncio readers/writers stay registered
+
+
+class _Transport(protocols.Transport, asyncio.Transport):
+    # protocols.Transport with the rest of the asyncio.Transport interface, so asyncio streams can use it
+    high_water = 65536     # Write buffer size at which the protocol is asked to pause_writing()
+    low_water = 16384
+
+    def __init__(self, loop, sock, protocol, extra=None):
+        asyncio.Transport.__init__(self, extra)
+        self._loop = loop
+        self._extra.update(socket=sock)
+        try:
+            self._extra.update(sockname=sock.getsockname(), peername=sock.getpeername())
+        except OSError:
+            pass
+        self._writing_paused = False
+        self._eof = False
+        protocols.Transport.__init__(self, sock, protocol, loop._sched)
+
+    def _read_ready(self):
+        try:
+            super()._read_ready()
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except BaseException as exc:
+            self._fatal_error(exc)     # A failing protocol closes its connection, not the whole loop
+
+    def write(self, data):
+        if self._eof:
+            raise RuntimeError('Cannot call write() after write_eof()')
+        super().write(data)
+        if not self._writing_paused and len(self.buffer) > self.high_water and not self.closed:
+            self._writing_paused = True
+            self.protocol.pause_writing()
+
+    def _write_ready(self):
+        try:
+            super()._write_ready()
+            if self._eof and not self.buffer and not self.closed:
+                self.sock.shutdown(socket.SHUT_WR)
+            if self._writing_paused and len(self.buffer) <= self.low_water:
+                self._writing_paused = False
+                self.protocol.resume_writing()
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except BaseException as exc:
+            self._fatal_error(exc)
+
+    def _fatal_error(self, exc):
+        if not isinstance(exc, OSError):
+            self._loop.call_exception_handler({'message': 'Fatal error on transport', 'exception': exc,
+                                               'transport': self, 'protocol': self.protocol})
+        self._force_close(exc)
+
+    def write_eof(self):
+        if self._eof or self.closing or self.closed:
+            return
+        self._eof = True
+        if not self.buffer:
+            self.sock.shutdown(socket.SHUT_WR)     # Otherwise shut down once the buffer is flushed
+
+    def can_write_eof(self):
+        return True
+
+    def abort(self):
+        self._force_close(None)
+
+    def is_closing(self):
+        return self.closing or self.closed
+
+    def is_reading(self):
+        return self.reading and not self.is_closing()
+
+    def get_write_buffer_size(self):
+        return len(self.buffer)
+
+    def get_write_buffer_limits(self):
+        return self.low_water, self.high_water
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        self.high_water = 65536 if high is None else high
+        self.low_water = self.high_water // 4 if low is None else low
+
+    def get_protocol(self):
+        return self.protocol
+
+    def set_protocol(self, protocol):
+        self.protocol = protocol
+
+
+class _Server(asyncio.AbstractServer):
+    def __init__(self, loop, sockets, protocol_factory, backlog):
+        self._loop = loop
+        self._sockets = sockets
+        self._protocol_factory = protocol_factory
+        self._backlog = backlog
+        self._servers = []       # One protocols.Server per listening socket, created by _start()
+        self._waiters = []
+        self._serving_forever = None
+
+    def _start(self):
+        if self._servers or self._sockets is None:
+            return
+        for sock in self._sockets:
+            sock.listen(self._backlog)
+            self._servers.append(protocols.Server(sock, self._protocol_factory, scheduler=self._loop._sched,
+                                                  transport=self._transport))
+
+    def _transport(self, sock, protocol, scheduler):
+        return _Transport(self._loop, sock, protocol)
+
+    def close(self):
+        if self._sockets is None:
+            return
+        for sock in self._sockets:
+            self._loop._sched._read_waiting.pop(sock, None)
+            sock.close()
+        self._sockets = None
+        self._servers = []
+        if self._serving_forever is not None and not self._serving_forever.done():
+            self._serving_forever.cancel()
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters = []
+
+    def get_loop(self):
+        return self._loop
+
+    def is_serving(self):
+        return bool(self._servers)
+
+    @property
+    def sockets(self):
+        return tuple(self._sockets or ())
+
+    async def start_serving(self):
+        self._start()
+
+    async def serve_forever(self):
+        if self._serving_forever is not None:
+            raise RuntimeError('serve_forever() is already running')
+        if self._sockets is None:
+            raise RuntimeError('Server is closed')
+        self._start()
+        self._serving_forever = self._loop.create_future()
+        try:
+            await self._serving_forever
+        except asyncio.CancelledError:
+            self.close()
+            raise
+        finally:
+            self._serving_forever = None
+
+    async def wait_closed(self):
+        if self._sockets is None:
+            return
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+
+class SchedulerEventLoop(asyncio.AbstractEventLoop):
+    def __init__(self):
+        self._sched = Scheduler()
+        self._readers = {}
+        self._writers = {}
+        self._running = False
+        self._closed = False
+        self._debug = False
+        self._task_factory = None
+        self._exception_handler = None
+        self._default_executor = None
+        self._timer_cancelled_count = 0     # Cancelled timers still in the heap
+        self._ssock, self._csock = socket.socketpair()    # Wakes select() from other threads
+        self._ssock.setblocking(False)
+        self._csock.setblocking(False)
+
+    # Running and stopping the loop
+    def run_forever(self):
+        if self._running:
+            raise RuntimeError('This event loop is already running')
+        if self._closed:
+            raise RuntimeError('Event loop is closed')
+        self._sched.read_wait(self._ssock.fileno(), self._read_from_self)
+        self._running = True
+        asyncio.events._set_running_loop(self)
+        try:
+            self._sched.run()
+        except _StopLoop:
+            pass
+        finally:
+            self._running = False
+            self._sched._read_waiting.pop(self._ssock.fileno(), None)
+            asyncio.events._set_running_loop(None)
+
+    def run_until_complete(self, future):
+        future = asyncio.ensure_future(future, loop=self)
+        future.add_done_callback(self._stop_on_done)
+        try:
+            self.run_forever()
+        finally:
+            future.remove_done_callback(self._stop_on_done)
+        if not future.done():
+            raise RuntimeError('Event loop stopped before Future completed.')
+        return future.result()
+
+    def _stop_on_done(self, future):
+        self.stop()
+
+    def stop(self):
+        self._sched.ready.append(_stop_loop)
+
+    def is_running(self):
+        return self._running
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        if self._running:
+            raise RuntimeError('Cannot close a running event loop')
+        if self._closed:
+            return
+        self._closed = True
+        self._sched.ready.clear()
+        self._sched.sleeping.clear()
+        self._timer_cancelled_count = 0
+        self._ssock.close()
+        self._csock.close()
+        executor = self._default_executor
+        if executor is not None:
+            self._default_executor = None
+            executor.shutdown(wait=False)
+
+    async def shutdown_asyncgens(self):
+        pass
+
+    async def shutdown_default_executor(self, timeout=None):
+        executor = self._default_executor
+        if executor is None:
+            return
+        fut = self.create_future()
+
+        def _shutdown():
+            executor.shutdown(wait=True)
+            self.call_soon_threadsafe(fut.set_result, None)
+
+        # Can't join the pool from one of its own threads
+        threading.Thread(target=_shutdown).start()
+        await fut
+
+    # Scheduling callbacks
+    def call_soon(self, callback, *args, context=None):
+        handle = _Handle(callback, args, self, context)
+        self._sched.call_soon(handle)
+        return handle
+
+    def call_soon_threadsafe(self, callback, *args, context=None):
+        handle = self.call_soon(callback, *args, context=context)
+        self._write_to_self()
+        return handle
+
+    def call_later(self, delay, callback, *args, context=None):
+        return self.call_at(self.time() + delay, callback, *args, context=context)
+
+    def call_at(self, when, callback, *args, context=None):
+        handle = _TimerHandle(when, callback, args, self, context)
+        self._sched.sequence += 1
+        heapq.heappush(self._sched.sleeping, (when, self._sched.sequence, handle))
+        handle._scheduled = True
+        return handle
+
+    def _timer_handle_cancelled(self, handle):
+        # Called by TimerHandle.cancel(). A cancelled timer stays in the heap and does nothing when it fires, but
+        # with many timeouts cancelled early the heap would keep growing, so it is rebuilt once they are half of it.
+        if not handle._scheduled:
+            return
+        self._timer_cancelled_count += 1
+        sleeping = self._sched.sleeping
+        if len(sleeping) > _MIN_SCHEDULED_TIMERS and self._timer_cancelled_count * 2 > len(sleeping):
+            live = []
+            for entry in sleeping:
+                if entry[2]._cancelled or entry[2] is handle:     # cancel() sets _cancelled after this call
+                    entry[2]._scheduled = False
+                else:
+                    live.append(entry)
+            heapq.heapify(live)
+            sleeping[:] = live
+            self._timer_cancelled_count = 0
+
+    def time(self):
+        return self._sched.clock()     # Same clock as Scheduler.call_later
+
+    def _read_from_self(self):
+        try:
+            while self._ssock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        self._sched.read_wait(self._ssock.fileno(), self._read_from_self)
+
+    def _write_to_self(self):
+        try:
+            self._csock.send(b'\0')
+        except OSError:
+            pass
+
+    # Futures and tasks
+    def create_future(self):
+        return asyncio.Future(loop=self)
+
+    def create_task(self, coro, *, name=None, context=None):
+        if self._task_factory is None:
+            return asyncio.Task(coro, loop=self, name=name, context=context)
+        task = self._task_factory(self, coro)
+        if name is not None:
+            task.set_name(name)
+        return task
+
+    def set_task_factory(self, factory):
+        self._task_factory = factory
+
+    def get_task_factory(self):
+        return self._task_factory
+
+    # Threads
+    def run_in_executor(self, executor, func, *args):
+        if executor is None:
+            if self._default_executor is None:
+                self._default_executor = concurrent.futures.ThreadPoolExecutor()
+            executor = self._default_executor
+        return asyncio.wrap_future(executor.submit(func, *args), loop=self)
+
+    def set_default_executor(self, executor):
+        self._default_executor = executor
+
+    # File descriptor watching
+    def add_reader(self, fd, callback, *args):
+        self._add_io(fd, callback, args, self._readers, self._sched._read_waiting)
+
+    def remove_reader(self, fd):
+        return self._remove_io(fd, self._readers, self._sched._read_waiting)
+
+    def add_writer(self, fd, callback, *args):
+        self._add_io(fd, callback, args, self._writers, self._sched._write_waiting)
+
+    def remove_writer(self, fd):
+        return self._remove_io(fd, self._writers, self._sched._write_waiting)
+
+    def _add_io(self, fd, callback, args, handles, waiting):
+        fd = _fileno(fd)
+        self._remove_io(fd, handles, waiting)
+        handle = _IOHandle(fd, waiting, callback, args, self)
+        handles[fd] = handle
+        waiting[fd] = handle
+
+    def _remove_io(self, fd, handles, waiting):
+        fd = _fileno(fd)
+        waiting.pop(fd, None)
+        handle = handles.pop(fd, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        return True
+
+    # Socket operations (sockets must be non-blocking)
+    async def sock_recv(self, sock, nbytes):
+        try:
+            return sock.recv(nbytes)
+        except (BlockingIOError, InterruptedError):
+            pass
+        return await self._wait_io(sock, self.add_reader, self.remove_reader, sock.recv, nbytes)
+
+    async def sock_recv_into(self, sock, buf):
+        try:
+            return sock.recv_into(buf)
+        except (BlockingIOError, InterruptedError):
+            pass
+        return await self._wait_io(sock, self.add_reader, self.remove_reader, sock.recv_into, buf)
+
+    async def sock_sendall(self, sock, data):
+        view = memoryview(data)
+        while view:
+            try:
+                sent = sock.send(view)
+            except (BlockingIOError, InterruptedError):
+                sent = await self._wait_io(sock, self.add_writer, self.remove_writer, sock.send, view)
+            view = view[sent:]
+
+    async def sock_accept(self, sock):
+        try:
+            return sock.accept()
+        except (BlockingIOError, InterruptedError):
+            pass
+        return await self._wait_io(sock, self.add_reader, self.remove_reader, sock.accept)
+
+    async def sock_connect(self, sock, address):
+        try:
+            sock.connect(address)
+            return
+        except (BlockingIOError, InterruptedError):
+            pass
+        await self._wait_io(sock, self.add_writer, self.remove_writer, lambda: None)
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            raise OSError(err, f'Connect call failed {address}')
+
+    async def _wait_io(self, sock, add, remove, func, *args):
+        fut = self.create_future()
+
+        def _ready():
+            if fut.done():
+                return
+            try:
+                result = func(*args)
+            except (BlockingIOError, InterruptedError):
+                return      # Spurious wakeup, keep waiting
+            except BaseException as exc:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
+
+        add(sock, _ready)
+        try:
+            return await fut
+        finally:
+            remove(sock)
+
+    # Name resolution blocks, so it goes to the thread pool like in asyncio
+    async def getaddrinfo(self, host, port, *, family=0, type=0, proto=0, flags=0):
+        return await self.run_in_executor(None, socket.getaddrinfo, host, port, family, type, proto, flags)
+
+    async def getnameinfo(self, sockaddr, flags=0):
+        return await self.run_in_executor(None, socket.getnameinfo, sockaddr, flags)
+
+    # Transports and protocols
+    async def create_connection(self, protocol_factory, host=None, port=None, *, ssl=None, family=0, proto=0,
+                                flags=0, sock=None, local_addr=None, server_hostname=None,
+                                ssl_handshake_timeout=None, ssl_shutdown_timeout=None,
+                                happy_eyeballs_delay=None, interleave=None):
+        if ssl:
+            raise NotImplementedError('SSL is not supported by SchedulerEventLoop')
+        if sock is None:
+            if host is None and port is None:
+                raise ValueError('host and port was not specified and no sock specified')
+            infos = await self.getaddrinfo(host, port, family=family, type=socket.SOCK_STREAM,
+                                           proto=proto, flags=flags)
+            if not infos:
+                raise OSError('getaddrinfo() returned empty list')
+            errors = []
+            for af, kind, proto, _, address in infos:
+                sock = socket.socket(af, kind, proto)
+                try:
+                    sock.setblocking(False)
+                    if local_addr is not None:
+                        sock.bind(local_addr)
+                    await self.sock_connect(sock, address)
+                    break
+                except OSError as exc:
+                    errors.append(exc)
+                    sock.close()
+                except BaseException:
+                    sock.close()
+                    raise
+            else:
+                if len(errors) == 1:
+                    raise errors[0]
+                raise OSError(f'Multiple exceptions: {", ".join(str(exc) for exc in errors)}')
+        elif sock.type != socket.SOCK_STREAM:
+            raise ValueError(f'A Stream Socket was expected, got {sock!r}')
+        protocol = protocol_factory()
+        transport = _Transport(self, sock, protocol)
+        return transport, protocol
+
+    async def create_server(self, protocol_factory, host=None, port=None, *, family=socket.AF_UNSPEC,
+                            flags=socket.AI_PASSIVE, sock=None, backlog=100, ssl=None, reuse_address=None,
+                            reuse_port=None, ssl_handshake_timeout=None, ssl_shutdown_timeout=None,
+                            start_serving=True):
+        if ssl:
+            raise NotImplementedError('SSL is not supported by SchedulerEventLoop')
+        if sock is not None:
+            sockets = [sock]
+        else:
+            hosts = [host] if host is None or isinstance(host, str) else list(host)
+            infos = set()
+            for host in hosts:
+                infos.update(await self.getaddrinfo(host, port, family=family, type=socket.SOCK_STREAM,
+                                                    flags=flags))
+            sockets = []
+            try:
+                for af, kind, proto, _, address in infos:
+                    sock = socket.socket(af, kind, proto)
+                    sockets.append(sock)
+                    if reuse_address is not False:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    if reuse_port:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                    if af == socket.AF_INET6:
+                        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)    # IPv4 gets its own socket
+                    sock.bind(address)
+            except BaseException:
+                for sock in sockets:
+                    sock.close()
+                raise
+        for sock in sockets:
+            sock.setblocking(False)
+        server = _Server(self, sockets, protocol_factory, backlog)
+        if start_serving:
+            server._start()
+        return server
+
+    # Error handling and debug mode
+    def get_exception_handler(self):
+        return self._exception_handler
+
+    def set_exception_handler(self, handler):
+        self._exception_handler = handler
+
+    def default_exception_handler(self, context):
+        message = context.get('message') or 'Unhandled exception in event loop'
+        exc = context.get('exception')
+        print(message, repr(exc) if exc else '')
+
+    def call_exception_handler(self, context):
+        if self._exception_handler is None:
+            self.default_exception_handler(context)
+        else:
+            self._exception_handler(self, context)
+
+    def get_debug(self):
+        return self._debug
+
+    def set_debug(self, enabled):
+        self._debug = enabled
+
+
+class SchedulerEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    _loop_factory = SchedulerEventLoop
+
+
+async def _ping(count):
+    for _ in range(count):
+        await asyncio.sleep(0)
+
+
+async def _timers(count):
+    for _ in range(count):
+        await asyncio.sleep(0.0001)
+
+
+async def workload():
+    await asyncio.gather(*(_ping(1000) for _ in range(100)))
+    await asyncio.gather(*(_timers(20) for _ in range(500)))
+
+
+def bench():
+    for name, factory in [('asyncio', asyncio.new_event_loop), ('io_scheduler', SchedulerEventLoop)]:
+        with asyncio.Runner(loop_factory=factory) as runner:
+            start = time.perf_counter()
+            runner.run(workload())
+            print(f'{name:>12}: {time.perf_counter() - start:.3f}s')
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    SchedulerEventLoop - реализация asyncio.AbstractEventLoop поверх планировщика из файла io_scheduler.py.
+    Благодаря ей обычный asyncio код (asyncio.sleep, gather, wait_for, ensure_future, run_in_executor, sock_recv и т.д.)
+    исполняется нашим циклом, а значит можно сравнить его скорость со стандартным циклом asyncio на одной и той же
+    нагрузке (функция bench).
+
+    Планировщик умеет вызывать только функции без аргументов, а asyncio передает в call_soon функцию вместе с
+    аргументами и контекстом. Поэтому каждый вызов оборачивается в объект asyncio.Handle, у которого есть метод
+    __call__ - точно также как Task оборачивает корутину, делая ее похожей на колбэк. Отмененный Handle при вызове
+    просто ничего не делает.
+
+    call_at / call_later - кладут TimerHandle напрямую в очередь спящих планировщика (self._sched.sleeping).
+    Время цикла (метод time) - это sched.clock(), то есть те же часы, что использует сам планировщик.
+
+    add_reader / add_writer - в планировщике ожидание сокета одноразовое: после срабатывания сокет удаляется из
+    словаря ожидающих. В asyncio же наблюдение за сокетом длится до вызова remove_reader / remove_writer. Поэтому
+    _IOHandle после вызова сам снова кладет себя в словарь ожидающих, если его не отменили.
+
+    run_forever - запускает sched.run(). Чтобы цикл не завершился, когда задач нет, в нем всегда ожидает чтения
+    служебный сокет (self._ssock). В него пишет call_soon_threadsafe, чтобы разбудить select() из другого потока.
+    stop() кладет в очередь готовых функцию, выбрасывающую исключение _StopLoop, которое прерывает sched.run().
+    Остальные готовые функции остаются в очереди и будут вызваны при следующем запуске цикла.
+
+    run_until_complete - оборачивает корутину в задачу, подписывает stop() на ее завершение и запускает run_forever.
+
+    SchedulerEventLoopPolicy - политика, создающая наш цикл вместо стандартного:
+    asyncio.set_event_loop_policy(SchedulerEventLoopPolicy()), после чего asyncio.run() работает на планировщике.
+
+    Отмена таймера (TimerHandle.cancel) не удаляет его из кучи - при срабатывании он просто ничего не делает. Но если
+    таймауты почти всегда отменяются раньше срока (wait_for), куча растет. Поэтому, как и в asyncio.BaseEventLoop,
+    цикл считает отмененные таймеры в куче (_timer_cancelled_count), и когда их больше половины, а таймеров больше
+    _MIN_SCHEDULED_TIMERS, куча перестраивается без них.
+
+    getaddrinfo / getnameinfo - блокирующие, поэтому выполняются в пуле потоков через run_in_executor.
+
+    create_connection / create_server (а значит и asyncio.open_connection / asyncio.start_server) - работают на
+    транспортах из файла protocols.py. _Transport - это protocols.Transport, дополненный до интерфейса
+    asyncio.Transport: get_extra_info, write_eof, abort, управление потоком записи (pause_writing/resume_writing у
+    протокола, когда буфер больше high_water / меньше low_water). Исключение в методе протокола закрывает только это
+    соединение и передается в call_exception_handler, а не прерывает весь цикл. _Server - asyncio.AbstractServer,
+    создающий protocols.Server на каждый слушающий сокет. SSL не поддерживается.
+"""
@@ -0,0 +1,120 @@
+from io_scheduler import sched, switch
+
+
+class BroadcastClosed(Exception):
+    pass
+
+
+class SubscriberLagged(Exception):
+    pass
+
+
+class Broadcast:
+    def __init__(self, capacity=1024, drop_lagging=False):
+        self.buffer = [None] * capacity     # Every item is stored once for all subscribers
+        self.capacity = capacity
+        self.seq = 0                 # Number of items published so far
+        self.waiting = []            # Subscribers waiting for the next item
+        self.drop_lagging = drop_lagging
+        self._closed = False
+
+    def subscribe(self):
+        return Subscriber(self)
+
+    def publish(self, item):
+        if self._closed:
+            raise BroadcastClosed()
+        self.buffer[self.seq % self.capacity] = item
+        self.seq += 1
+        if self.waiting:
+            sched.ready.extend(self.waiting)   # One publish wakes every waiting subscriber
+            self.waiting = []
+
+    def close(self):
+        self._closed = True
+        sched.ready.extend(self.waiting)
+        self.waiting = []
+
+
+class Subscriber:
+    def __init__(self, channel):
+        self.channel = channel
+        self.cursor = channel.seq    # Sees only items published after subscribing
+        self.lagged = 0              # Items overwritten before this subscriber read them
+        self.dropped = False
+
+    async def get(self):
+        channel = self.channel
+        if self.dropped:
+            raise SubscriberLagged()
+        while self.cursor == channel.seq:
+            if channel._closed:
+                raise BroadcastClosed()
+            channel.waiting.append(sched.current)
+            sched.current = None
+            await switch()
+
+        oldest = channel.seq - channel.capacity
+        if self.cursor < oldest:
+            if channel.drop_lagging:
+                self.dropped = True
+                raise SubscriberLagged()
+            self.lagged += oldest - self.cursor
+            self.cursor = oldest       # Skip to the oldest item still in the ring
+
+        item = channel.buffer[self.cursor % channel.capacity]
+        self.cursor += 1
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except BroadcastClosed:
+            raise StopAsyncIteration
+
+
+async def producer(channel, count):
+    for n in range(count):
+        print('Publishing', n)
+        channel.publish(n)
+        await sched.sleep(0.1)
+    channel.close()
+
+
+async def subscriber(name, sub, delay):
+    async for item in sub:
+        print(name, 'got', item, 'lagged' if sub.lagged else '')
+        await sched.sleep(delay)
+    print(name, 'done, missed', sub.lagged)
+
+
+if __name__ == '__main__':
+    feed = Broadcast(capacity=4)
+    sched.new_task(subscriber('fast', feed.subscribe(), 0))
+    sched.new_task(subscriber('slow', feed.subscribe(), 0.5))
+    sched.new_task(producer(feed, 20))
+    sched.run()
+
+
+"""
+    Broadcast - канал, в котором каждый опубликованный элемент получают все подписчики, в отличии от AsyncQueue, где
+    элемент достается только одному потребителю.
+
+    Элементы хранятся один раз в кольцевом буфере фиксированного размера (self.buffer), а не копируются в отдельную
+    очередь каждого подписчика. self.seq - сколько элементов опубликовано за все время, элемент с номером n лежит в
+    ячейке n % capacity. Каждый подписчик хранит свой курсор - номер следующего элемента, который он прочитает.
+
+    publish - кладет элемент в буфер, затирая самый старый, и одним проходом переносит всех ожидающих подписчиков в
+    очередь готовых. Ничего не ждет, поэтому может вызываться и из обычных функций.
+
+    Subscriber.get - если новых элементов нет, подписчик засыпает в общей очереди ожидающих канала. Если подписчик
+    отстал больше чем на capacity элементов, то часть элементов уже затерта. Тогда он либо перескакивает к самому
+    старому сохранившемуся элементу и запоминает число пропущенных элементов (self.lagged), либо, если канал создан с
+    drop_lagging=True, отключается и получает исключение SubscriberLagged.
+
+    close - закрывает канал и будит подписчиков. Они дочитывают оставшиеся элементы, после чего get() выбрасывает
+    BroadcastClosed, а цикл async for завершается.
+"""
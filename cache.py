@@ -0,0 +1,140 @@
+from collections import OrderedDict
+
+from io_scheduler import sched, Event
+
+
+class _Flight:
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.exc = None
+
+
+class AsyncCache:
+    def __init__(self, ttl=60.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()    # key -> (expires, value), least recently used first
+        self.in_flight = {}             # key -> _Flight of the running computation
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0              # Callers that waited for somebody else's computation
+
+    async def get(self, key, compute, *args):
+        entry = self.entries.get(key)
+        if entry:
+            if entry[0] > sched.clock():
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+            del self.entries[key]       # Expired
+
+        flight = self.in_flight.get(key)
+        if flight:
+            self.coalesced += 1
+            await flight.done.wait()
+            if flight.exc:
+                raise flight.exc
+            return flight.value
+
+        self.misses += 1
+        flight = self.in_flight[key] = _Flight()
+        try:
+            flight.value = await compute(*args)
+        except Exception as exc:
+            flight.exc = exc            # Waiting callers get the error, nothing is stored
+            raise
+        else:
+            self.entries[key] = (sched.clock() + self.ttl, flight.value)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            return flight.value
+        finally:
+            del self.in_flight[key]
+            flight.done.set()
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'in_flight': len(self.in_flight),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
+
+
+def cached(ttl=60.0, maxsize=1024):
+    def decorate(func):
+        cache = AsyncCache(ttl, maxsize)
+
+        async def wrapper(*args):
+            return await cache.get(args, func, *args)
+
+        wrapper.cache = cache
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        return wrapper
+    return decorate
+
+
+calls = 0
+
+
+@cached(ttl=1.0, maxsize=100)
+async def fetch_user(user_id):
+    global calls
+    calls += 1
+    await sched.sleep(0.2)      # A slow backend call
+    if user_id < 0:
+        raise ValueError('No such user')
+    return {'id': user_id, 'name': f'user{user_id}'}
+
+
+async def handler(user_id):
+    try:
+        print('Handler got', await fetch_user(user_id))
+    except ValueError as exc:
+        print('Handler failed:', exc)
+
+
+async def main():
+    for user_id in (1, 1, 1, 2, -1, -1):     # Concurrent requests for the same users
+        sched.new_task(handler(user_id))
+    await sched.sleep(0.5)
+    await handler(1)                        # Cached
+    await handler(-1)                       # Failure was not cached, computed again
+    await sched.sleep(1.0)
+    await handler(1)                        # Expired, computed again
+    print('Backend calls:', calls, fetch_user.cache.stats())
+
+
+if __name__ == '__main__':
+    sched.new_task(main())
+    sched.run()
+
+
+"""
+    AsyncCache - кэш результатов корутин для обработчиков, которые одновременно запрашивают одно и то же значение у
+    медленного сервиса (базы данных, другого сервера).
+
+    get(key, compute, *args) - если для ключа есть свежее значение, сразу его возвращает (hits). Иначе, если значение для
+    этого ключа уже вычисляется другой задачей, то вызывающий не запускает второе вычисление, а ждет первое (coalesced):
+    у вычисления есть Event, который устанавливается по окончании, и все ожидающие получают тот же результат или ту же
+    ошибку. Только если вычисления нет, запускается await compute(*args) (misses). Так на наплыв одинаковых запросов
+    приходится один вызов сервиса ("single flight").
+
+    Значения хранятся ttl секунд по часам планировщика (sched.clock()), поэтому в режиме виртуального времени
+    (simulation.py) истечение проверяется без ожидания. Число значений ограничено maxsize: OrderedDict хранит ключи в
+    порядке использования, при попадании ключ переносится в конец, а при переполнении удаляется самый давно
+    использованный (LRU). Ошибки не кэшируются: если compute выбросил исключение, его получают все, кто ждал это
+    вычисление, но следующий вызов запустит вычисление заново.
+
+    cached(ttl, maxsize) - декоратор для корутины, ключом служит кортеж ее аргументов. Сам кэш доступен как
+    атрибут .cache функции, например для fetch_user.cache.stats() или fetch_user.cache.invalidate((1,)).
+"""
@@ -7,21 +7,21 @@ sched = Scheduler()     # Behind scenes scheduler object
 class AsyncQueue:
     def __init__(self):
         self.items = deque()
-        self.waiting = deque()    # All getters waiting for data
+        self.waiting = deque()    # Callbacks of all getters waiting for data
 
     def put(self, item):
         self.items.append(item)
         if self.waiting:
-            func = self.waiting.popleft()
-            # Do we call it right away? No. Schedule it to be called.
-            sched.call_soon(func)
+            callback = self.waiting.popleft()
+            # Do we call it right away? No. Schedule get() to be called again.
+            sched.call_soon(self.get, callback)
 
     def get(self, callback):
         # Wait until an item is available. Then return it
         if self.items:
             callback(self.items.popleft())
         else:
-            self.waiting.append(lambda: self.get(callback))
+            self.waiting.append(callback)
             print('put into waiting')
 
 
@@ -33,7 +33,7 @@ def producer(q, count):
         if n < count:
             print('Producing', n)
             q.put(n)
-            sched.call_later(2, lambda: _run(n + 1))
+            sched.call_later(2, _run, n + 1)
         else:
             print('Producer done')
             q.put(None)
@@ -55,20 +55,20 @@ def consumer(q):
             print('Consumer done')
         else:
             print('Consuming', item)
-            sched.call_soon(lambda: consumer(q))
+            sched.call_soon(consumer, q)
 
     q.get(callback=_consume)
 
 
 """
     Потребитель пытается получить данные
-    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(lambda: consumer(q)))
+    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(consumer, q))
     Если в очереди данных нет, он их ждет
     Повторяет он эти действия до тех пор, пока производитель данных не прекратит свою работу
 """
 
-sched.call_soon(lambda: producer(aq, 10))
-sched.call_soon(lambda: consumer(aq,))
+sched.call_soon(producer, aq, 10)
+sched.call_soon(consumer, aq)
 sched.run()
 
 
@@ -94,8 +94,9 @@ sched.run()
 
     Более подробно:
     Вызывает функцию потребитель передавая ей первый елемент из очереди
-    Если очередь елементов пуста, вставляет в очередь ожидающих геттеров себя же, вместе с переданным ему в аргументы
-    потребителем.
+    Если очередь елементов пуста, вставляет в очередь ожидающих геттеров переданного ему в аргументы потребителя.
+    Когда данные появятся, put() отдает планировщику вызов get(callback): sched.call_soon(self.get, callback), без
+    создания lambda.
 
     Идея заключается в том, что при отсутствии данных, вызов потребителя откладывается на более поздний
     момент, когда производитель положит данные в очередь.
@@ -9,6 +9,8 @@ class QueueClosed(Exception):
 
 
 class Result:
+    __slots__ = ('value', 'exc')     # One is created per get(), keep it small
+
     def __init__(self, value=None, exc=None):
         self.value = value
         self.exc = exc
@@ -20,17 +22,20 @@ class Result:
             return self.value
 
 
+CLOSED = Result(exc=QueueClosed)    # Shared error result, raising the class creates a fresh exception
+
+
 class AsyncQueue:
     def __init__(self):
         self.items = deque()
-        self.waiting = deque()    # All getters waiting for data
+        self.waiting = deque()    # Callbacks of all getters waiting for data
         self._closed = False    # Can queue be used anymore?
 
     def close(self):
         self._closed = True
         if self.waiting and not self.items:
-            for func in self.waiting:
-                sched.call_soon(func)
+            for callback in self.waiting:
+                sched.call_soon(self.get, callback)
 
     def put(self, item):
         if self._closed:
@@ -38,21 +43,21 @@ class AsyncQueue:
 
         self.items.append(item)
         if self.waiting:
-            func = self.waiting.popleft()
-            # Do we call it right away? No. Schedule it to be called.
-            sched.call_soon(func)
+            callback = self.waiting.popleft()
+            # Do we call it right away? No. Schedule get() to be called again.
+            sched.call_soon(self.get, callback)
 
     def get(self, callback):
         # Wait until an item is available. Then return it
         # Question: How does a closed queue interact  with get()
         if self.items:
-            callback(Result(value=self.items.popleft()))  # Good result
+            callback(Result(self.items.popleft()))  # Good result
         else:
             # No items available (must wait)
             if self._closed:
-                callback(Result(exc=QueueClosed()))  # Error result
+                callback(CLOSED)  # Error result
             else:
-                self.waiting.append(lambda: self.get(callback))
+                self.waiting.append(callback)
                 print('put into waiting')
 
 
@@ -64,7 +69,7 @@ def producer(q, count):
         if n < count:
             print('Producing', n)
             q.put(n)
-            sched.call_later(2, lambda: _run(n + 1))
+            sched.call_later(2, _run, n + 1)
         else:
             print('Producer done')
             q.close()   # Means no more items will be produced
@@ -85,7 +90,7 @@ def consumer(q):
         try:
             item = result.result()
             print('Consuming', item)
-            sched.call_soon(lambda: consumer(q))
+            sched.call_soon(consumer, q)
 
         except QueueClosed:
             print('Consumer done')
@@ -95,7 +100,7 @@ def consumer(q):
 
 """
     Потребитель пытается получить данные
-    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(lambda: consumer(q)))
+    Если в очереди есть готовые данные, он берет их, обрабатывает и запрашивает по новой (sched.call_soon(consumer, q))
     Если в очереди данных нет, он их ждет
     Повторяет он эти действия до тех пор, пока производитель данных не прекратит свою работу
     Когда производитель завершает свою работу, то он закрывает очередь и потребитель вместо данных получает ошибку,
@@ -103,9 +108,10 @@ def consumer(q):
 """
 
 
-sched.call_soon(lambda: producer(aq, 10))
-sched.call_soon(lambda: consumer(aq,))
-sched.run()
+if __name__ == '__main__':
+    sched.call_soon(producer, aq, 10)
+    sched.call_soon(consumer, aq)
+    sched.run()
 
 
 """
@@ -138,8 +144,14 @@ sched.run()
     Вызывает функцию потребитель передавая ей объект result с данными
 
     Если очередь пуста и закрыта, вызывает потребителя, передавая ему объект result с ошибкой
-    Если очередь пуста, но открыта, вставляет в очередь ожидающих геттеров себя же, вместе с
-    переданным ему в аргументы потребителем.
+    Если очередь пуста, но открыта, вставляет в очередь ожидающих геттеров переданного ему в аргументы потребителя.
+    Когда данные появятся, put() отдает планировщику вызов get(callback): sched.call_soon(self.get, callback), без
+    создания lambda.
+
+    Для данных get() каждый раз создает новый объект Result: потребитель может сохранить его и прочитать позже, и
+    следующий get() не подменит в нем значение. Чтобы это было дешево, у Result объявлены __slots__. Для ошибки
+    используется общий для всех очередей объект CLOSED - он никогда не меняется, а исключение создается заново при
+    каждом raise, так как в нем хранится класс QueueClosed, а не его экземпляр.
 
     Идея заключается в том, что при отсутствии данных, вызов потребителя откладывается на более поздний
     момент, когда производитель положит данные в очередь.
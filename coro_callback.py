@@ -9,32 +9,38 @@ class Scheduler:
         self.sleeping = []       # Sleeping functions
         self.sequence = 0
         self.current = None
+        self.eager = False      # new_task() runs the coroutine right away, up to its first wait
 
-    def call_soon(self, func):
-        self.ready.append(func)
+    def call_soon(self, func, *args):
+        self.ready.append((func, args))     # Queue items are (function, arguments) pairs
 
-    def call_later(self, delay, func):
+    def call_later(self, delay, func, *args):
         self.sequence += 1
         deadline = time.time() + delay     # Expiration time
-        heapq.heappush(self.sleeping, (deadline, self.sequence, func))
+        heapq.heappush(self.sleeping, (deadline, self.sequence, func, args))
         
     def run(self):
         while self.ready or self.sleeping:
             if not self.ready:
                 # Find the nearest deadline
-                deadline, _, func = heapq.heappop(self.sleeping)
+                deadline, _, func, args = heapq.heappop(self.sleeping)
                 delta = deadline - time.time()
                 if delta > 0:
                     time.sleep(delta)
-                self.ready.append(func)
+                self.ready.append((func, args))
 
             while self.ready:
-                func = self.ready.popleft()
-                func()
+                func, args = self.ready.popleft()
+                func(*args)
 
     # Coroutine-based functions 
     def new_task(self, coro):
-        self.ready.append(Task(coro))   # Wrapped coroutine
+        if not self.eager:
+            self.ready.append((Task(coro), ()))   # Wrapped coroutine, no arguments
+            return
+        current = self.current
+        Task(coro)()
+        self.current = current
 
     async def sleep(self, delay):
         self.call_later(delay, self.current)  
@@ -53,7 +59,7 @@ class Task:
 
             self.coro.send(None)
             if sched.current:
-                sched.ready.append(self)
+                sched.ready.append((self, ()))
         except StopIteration:
             pass
 
@@ -78,7 +84,7 @@ class AsyncQueue:
     async def put(self, item):
         self.items.append(item)
         if self.waiting:
-            sched.ready.append(self.waiting.popleft())
+            sched.ready.append((self.waiting.popleft(), ()))
 
     async def get(self):
         if not self.items:
@@ -117,19 +123,19 @@ sched.new_task(consumer(q))
 def countdown(n):
     if n > 0:
         print('Down', n)
-        sched.call_later(4, lambda: countdown(n - 1))
+        sched.call_later(4, countdown, n - 1)
 
 
 def countup(stop):
     def _run(x):
         if x < stop:
             print('Up', x)
-            sched.call_later(1, lambda: _run(x + 1))
+            sched.call_later(1, _run, x + 1)
     _run(0)
 
 
-sched.call_soon(lambda: countdown(5))
-sched.call_soon(lambda: countup(20))
+sched.call_soon(countdown, 5)
+sched.call_soon(countup, 20)
 sched.run()
 
 
@@ -150,10 +156,15 @@ sched.run()
     Цикла в методе __call__ нет, так как он реализован снаружи в методе планировщика run().
     В этом цикле как раз и вызывается либо функция обратного вызова либо наш калабл объект
 
+    Функции обратного вызова получают аргументы через call_soon(func, *args) и call_later(delay, func, *args), как в
+    callbacks/scheduler.py: очереди хранят пары (функция, аргументы), а не замыкания lambda. Задачи Task аргументов не
+    имеют и кладутся в очередь готовых парой (task, ()).
+
     Также к планировщику основанному на колбэках, для работы с корутинами добавлено 2 метода - new_task и sleep
 
     new_task - Если мы хотим положить корутину в очередь готовых к вызову, то отдаем ее в метод планировщика new_task,
-    который оборачивает корутину в калабл объект класса Task и кладет в очередь.
+    который оборачивает корутину в калабл объект класса Task и кладет в очередь. Если sched.eager = True, то задача
+    сразу вызывается внутри new_task и выполняется до первого ожидания, а в очередь попадает только если заснула.
 
     sleep - Метод sleep же внутри себя вызывает метод планировщика call_later, передает туда время, через которое корутина
     должна быть вызвана и саму текущую, исполняемую корутину, из которой и был вызван метод sleep. После того, как корутина
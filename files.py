@@ -0,0 +1,219 @@
+import contextlib
+import mmap
+import os
+import resource
+import tempfile
+import time
+from socket import socketpair
+
+from io_scheduler import sched
+
+
+class FileReader:
+    def __init__(self, path, chunk_size=1 << 18, readahead=4):
+        if chunk_size % mmap.PAGESIZE:
+            raise ValueError('chunk_size must be a multiple of the page size')
+        self.fd = os.open(path, os.O_RDONLY)
+        self.size = os.fstat(self.fd).st_size
+        self.map = mmap.mmap(self.fd, self.size, prot=mmap.PROT_READ) if self.size else None
+        self.view = memoryview(self.map) if self.map else memoryview(b'')
+        self.chunk_size = chunk_size
+        self.readahead = readahead      # Chunks loaded by the thread pool ahead of the reader
+        self.loading = {}               # Chunk offset -> future of its load
+        self.ahead = 0                  # Everything before this offset is loaded or being loaded
+        self._scratch = bytearray(chunk_size)   # Target of loads, the data itself is not needed
+        self._probe = bytearray(1)
+        self.hits = 0                   # Chunks that were already in the page cache
+        self.misses = 0                 # Chunks the reader had to wait for
+
+    def _resident(self, start, end):
+        # RWF_NOWAIT reads only from the page cache, so the first and the last page tell cheaply if a
+        # chunk was read before. Where the flag is not supported, the chunk is loaded by a thread.
+        try:
+            return (os.preadv(self.fd, [self._probe], start, os.RWF_NOWAIT) == 1 and
+                    os.preadv(self.fd, [self._probe], end - 1, os.RWF_NOWAIT) == 1)
+        except OSError:
+            return False
+
+    def _load(self, start, end):
+        # Runs in a pool thread: a plain read brings the pages into the page cache with the GIL released.
+        # Touching the mmap instead would take the page faults while holding the GIL.
+        os.preadv(self.fd, [memoryview(self._scratch)[:end - start]], start)
+
+    def _read_ahead(self, offset):
+        limit = min(offset + self.readahead * self.chunk_size, self.size)
+        start = max(self.ahead, offset)
+        while start < limit:
+            end = min(start + self.chunk_size, self.size)
+            if not self._resident(start, end):
+                self.loading[start] = sched.submit_to_thread(self._load, start, end)
+            start = end
+        self.ahead = max(self.ahead, limit)
+
+    async def read(self, offset, size):
+        # A memoryview of the mapped file: no copy, and the pages are already in memory
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return memoryview(b'')
+        future = self.loading.pop(offset, None)
+        if future is None and offset >= self.ahead and not self._resident(offset, end):
+            future = sched.submit_to_thread(self._load, offset, end)
+        if future is not None and not future.done():
+            self.misses += 1
+            await sched.wait_future(future)
+        else:
+            self.hits += 1
+        self._read_ahead(end)
+        return self.view[offset:end]
+
+    async def chunks(self, start=0, end=None, release=True):
+        # start must be page aligned. With release=True the pages of a chunk are unmapped once the
+        # next chunk is requested, so streaming a huge file keeps the resident memory flat.
+        end = self.size if end is None else min(end, self.size)
+        offset = start
+        while offset < end:
+            chunk = await self.read(offset, min(self.chunk_size, end - offset))
+            size = len(chunk)
+            try:
+                yield chunk
+            finally:
+                chunk.release()     # Also when the consumer stops early, or close() can't unmap the file
+            if release:
+                self.map.madvise(mmap.MADV_DONTNEED, offset, size)
+            offset += size
+
+    def close(self):
+        for future in self.loading.values():
+            future.cancel()
+        os.close(self.fd)       # First, so the descriptor never leaks whatever happens to the mapping
+        self.view.release()
+        if self.map:
+            try:
+                self.map.close()
+            except BufferError:
+                pass    # A chunk is still referenced somewhere, the file is unmapped when it is released
+
+
+class FileWriter:
+    def __init__(self, path, append=False):
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+        self.fd = os.open(path, flags, 0o644)
+
+    async def write(self, data):
+        # A write usually only copies into the page cache, but it can block on a busy disk
+        view = memoryview(data)
+        while view:
+            view = view[await sched.run_in_thread(os.write, self.fd, view):]
+
+    async def close(self):
+        await sched.run_in_thread(os.close, self.fd)
+
+
+async def send_file(sock, path, chunk_size=1 << 18):
+    reader = FileReader(path, chunk_size)
+    try:
+        # aclosing: if send() fails, the generator is closed right away and releases its chunk before reader.close()
+        async with contextlib.aclosing(reader.chunks()) as chunks:
+            async for chunk in chunks:
+                sent = 0
+                while sent < len(chunk):
+                    sent += await sched.send(sock, chunk[sent:])
+    finally:
+        reader.close()
+    return reader
+
+
+async def _receive(sock, writer, stats):
+    while True:
+        data = await sched.recv(sock, 1 << 18)
+        if not data:
+            break
+        stats['received'] += len(data)
+        if writer:
+            await writer.write(data)
+    if writer:
+        await writer.close()
+    sock.close()
+
+
+async def _send(sock, path, stats):
+    reader = await send_file(sock, path)
+    sock.close()
+    stats['hits'], stats['misses'] = reader.hits, reader.misses
+
+
+def _rss():
+    # Current resident memory in kilobytes
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * mmap.PAGESIZE // 1024
+
+
+def bench(size=256 << 20):
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'source.bin')
+        with open(source, 'wb') as f:
+            for _ in range(size >> 20):
+                f.write(os.urandom(1 << 20))
+            f.flush()
+            os.fsync(f.fileno())
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)     # Start with the file out of the cache
+
+        for name, copy in (('cold, to socket', None), ('warm, to socket', None),
+                           ('warm, socket to file', os.path.join(directory, 'copy.bin'))):
+            left, right = socketpair()
+            left.setblocking(False)
+            right.setblocking(False)
+            stats = {'received': 0}
+            writer = FileWriter(copy) if copy else None
+            rss = _rss()
+            sched.new_task(_send(left, source, stats))
+            sched.new_task(_receive(right, writer, stats))
+            start = time.perf_counter()
+            sched.run()
+            elapsed = time.perf_counter() - start
+            print(f'{name:>20}: {stats["received"] / elapsed / 1e6:,.0f} MB/sec, '
+                  f'{stats["hits"]} chunks from cache, {stats["misses"]} waited for, '
+                  f'memory growth {(_rss() - rss) // 1024} MB for a {size >> 20} MB file')
+    print(f'Peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB')
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    Чтение и запись файлов без блокировки планировщика. Чтение большого файла внутри корутины обычным read() блокирует
+    весь цикл, пока данные читаются с диска, а чтение файла целиком в память занимает столько памяти, сколько весит файл.
+
+    FileReader - файл отображается в память через mmap, и read() возвращает memoryview на кусок отображения, то есть
+    данные не копируются: sched.send() отправляет их в сокет прямо из страничного кэша операционной системы.
+    Но обращение к странице, которой еще нет в памяти, заставит поток ждать диск (page fault), поэтому перед тем как
+    отдать кусок, проверяется, есть ли он в страничном кэше: os.preadv() с флагом RWF_NOWAIT читает только из кэша и
+    выбрасывает ошибку, если данных там нет. Проверяются первая и последняя страница куска.
+    Если куска в кэше нет, то его загружает поток из пула (sched.submit_to_thread и sched.wait_future, пул из
+    thread_workers потоков): обычный os.preadv() во временный буфер, который ждет диск с отпущенным GIL. Задача тем
+    временем спит, а другие задачи работают. После загрузки кусок отдается так же, через memoryview.
+    Упреждающее чтение (readahead): после каждого read() в пул отправляется загрузка следующих readahead кусков, поэтому
+    при последовательном чтении нужные данные обычно уже в памяти к моменту запроса. hits - сколько кусков было
+    готово сразу, misses - сколько раз задаче пришлось ждать загрузку.
+
+    chunks() - асинхронный итератор по кускам файла размером chunk_size: async for chunk in reader.chunks(). Когда
+    запрошен следующий кусок, страницы предыдущего убираются из отображения (madvise MADV_DONTNEED). Данные при этом
+    остаются в страничном кэше, но не засчитываются процессу, поэтому при отправке файла в несколько гигабайт
+    занятая процессом память не растет. Значит и ссылку на предыдущий кусок нельзя хранить после перехода к
+    следующему. Кусок освобождается в finally, поэтому и при досрочном выходе из цикла (break, ошибка) генератор, как
+    только его закроют, не держит отображение.
+
+    close() - сначала закрывает дескриптор файла, а потом отображение. Если кто-то еще держит кусок, mmap.close()
+    выбросил бы BufferError и скрыл исключение, из-за которого закрывают файл, поэтому эта ошибка игнорируется:
+    отображение удалится, когда освободится последний кусок.
+
+    FileWriter - запись тоже выполняется в пуле потоков: обычно она только копирует данные в страничный кэш, но если
+    диск не успевает, write() может надолго заблокироваться.
+
+    send_file(sock, path) - отправляет файл в сокет кусками. Генератор chunks() закрывается через
+    contextlib.aclosing: иначе при ошибке send() он закрылся бы только сборщиком мусора, уже после reader.close().
+
+    bench - отправляет файл через пару сокетов: сначала файл не в кэше, затем в кэше, затем принятые данные
+    записываются в другой файл. Выводит скорость, сколько кусков пришлось ждать и насколько выросла занятая память.
+"""
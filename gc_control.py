@@ -0,0 +1,177 @@
+import gc
+import time
+from select import select
+from socket import socketpair
+
+from io_scheduler import sched
+
+
+class GCControl:
+    def __init__(self, freeze=True, busy_factor=100, min_idle=0.005):
+        self.freeze = freeze
+        self.busy_factor = busy_factor  # Allow this many times more allocations than usual while busy
+        self.min_idle = min_idle        # A full collection only if select() would sleep at least this long
+        self.thresholds = gc.get_threshold()
+        self.managed = False
+        # Pause metrics, filled by the gc callback for any collection, automatic or ours
+        self.pauses = 0
+        self.pause_total = 0.0
+        self.pause_max = 0.0
+        self.busy_pauses = 0            # Collections that stopped running tasks
+        self._idle = False
+        self._start = 0.0
+
+    def watch(self):
+        gc.callbacks.append(self._on_gc)
+
+    def start(self):
+        # Call after startup, when the long-lived objects (modules, servers, caches) are created
+        if self.freeze:
+            gc.collect()
+            gc.freeze()         # Move everything to the permanent generation, never scanned again
+        gc.disable()
+        self.watch()
+        self.managed = True
+        sched.gc_control = self
+
+    def stop(self):
+        gc.callbacks.remove(self._on_gc)
+        if self.managed:
+            sched.gc_control = None
+            gc.enable()
+            if self.freeze:
+                gc.unfreeze()
+            self.managed = False
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._start = time.perf_counter()
+            return
+        pause = time.perf_counter() - self._start
+        self.pauses += 1
+        self.pause_total += pause
+        self.pause_max = max(self.pause_max, pause)
+        if not self._idle:
+            self.busy_pauses += 1
+
+    def _generation(self):
+        # Same rule as the automatic collector: the oldest generation over its threshold
+        count0, count1, count2 = gc.get_count()
+        threshold0, threshold1, threshold2 = self.thresholds
+        if count0 <= threshold0:
+            return None
+        if count1 > threshold1:
+            return 2 if count2 > threshold2 else 1
+        return 0
+
+    # Called by the scheduler loop
+    def busy(self):
+        # Safety valve: the loop may have no idle time at all, keep garbage from growing forever
+        if gc.get_count()[0] > self.thresholds[0] * self.busy_factor:
+            gc.collect(0)
+
+    def idle(self, timeout, read_waiting, write_waiting):
+        generation = self._generation()
+        if generation is None:
+            return
+        if generation == 2 and timeout is not None and timeout < self.min_idle:
+            generation = 1      # Not enough time before the next timer
+        if read_waiting or write_waiting:
+            can_read, can_write, _ = select(read_waiting, write_waiting, [], 0)
+            if can_read or can_write:
+                return          # Work is already waiting, collect next time
+        self._idle = True
+        gc.collect(generation)
+        self._idle = False
+
+    def stats(self):
+        return {
+            'gc_pauses': self.pauses,
+            'gc_busy_pauses': self.busy_pauses,
+            'gc_pause_total': self.pause_total,
+            'gc_pause_max': self.pause_max,
+        }
+
+
+class Node:
+    def __init__(self, data):
+        self.data = data
+        self.parent = self      # A reference cycle, only the cyclic collector frees it
+
+
+async def client(sock, bursts, size):
+    for _ in range(bursts):
+        for _ in range(size):
+            await sched.send(sock, b'ping')
+            await sched.recv(sock, 100)
+        await sched.sleep(0.01)      # Pause between bursts of requests
+    sock.close()
+
+
+async def server(sock):
+    while True:
+        data = await sched.recv(sock, 100)
+        if not data:
+            break
+        garbage = [Node(data) for _ in range(10)]
+        await sched.send(sock, garbage[0].data)
+    sock.close()
+
+
+def workload(pairs=20, bursts=30, size=50):
+    for _ in range(pairs):
+        a, b = socketpair()
+        sched.new_task(client(a, bursts, size))
+        sched.new_task(server(b))
+    start = time.perf_counter()
+    sched.run()
+    return time.perf_counter() - start
+
+
+def bench():
+    long_lived = [{'id': n, 'tags': [n]} for n in range(300000)]   # Caches, sessions, ...
+    for managed in (False, True):
+        control = GCControl()
+        if managed:
+            control.start()
+        else:
+            control.watch()     # Only measure the automatic collector
+        elapsed = workload()
+        control.stop()
+        stats = control.stats()
+        print(f'{"managed" if managed else "automatic":>9}: {elapsed:.2f}s, {stats["gc_pauses"]} collections, '
+              f'{stats["gc_busy_pauses"]} while busy, max pause {stats["gc_pause_max"] * 1000:.1f} ms, '
+              f'total {stats["gc_pause_total"] * 1000:.0f} ms')
+    del long_lived
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    Управление сборщиком мусора для цикла планировщика. Циклический сборщик мусора CPython запускается сам, когда
+    создано больше объектов, чем указано в пороге (gc.get_threshold()), то есть в случайный момент посреди обработки
+    запросов. Если в памяти много долгоживущих объектов (корутины, соединения, кэши), то сборка старшего поколения
+    обходит их все и останавливает все задачи на миллисекунды - это видно как выбросы задержки ответа.
+
+    GCControl.start() - вызывается после запуска сервера, когда долгоживущие объекты уже созданы:
+    1 gc.freeze() переносит все существующие объекты в постоянное поколение, которое сборщик больше не обходит.
+    2 gc.disable() выключает автоматическую сборку. Вместо нее планировщик сам решает, когда собирать мусор.
+
+    idle - планировщик вызывает ее перед тем, как заснуть в select(). Если по счетчикам gc.get_count() пора собирать
+    мусор, то сначала select() с нулевым таймаутом проверяет, нет ли уже готовых сокетов, и если их нет, то
+    выполняется gc.collect() одного поколения - по тому же правилу, что у автоматического сборщика. Полная сборка
+    (поколение 2) делается только если до ближайшего таймера есть хотя бы min_idle секунд. Так сборка мусора
+    происходит в то время, когда цикл все равно простаивал бы.
+
+    busy - вызывается перед выполнением готовых задач. Если простоя долго нет, то мусор все равно надо собирать:
+    когда объектов создано в busy_factor раз больше обычного порога, выполняется быстрая сборка молодого поколения.
+
+    Для метрик в gc.callbacks регистрируется функция, которая замеряет каждую паузу сборщика, и отдельно считает паузы,
+    случившиеся во время выполнения задач (busy_pauses). stats() отдает их в том же виде, что sched.stats().
+
+    bench - запускает одну и ту же нагрузку (пачки запросов с паузами между ними, на каждый запрос создается мусор с
+    циклическими ссылками) с автоматическим сборщиком и с GCControl и выводит число пауз, сколько из них пришлось на
+    выполнение задач, самую долгую паузу и суммарное время пауз.
+"""
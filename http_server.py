@@ -0,0 +1,347 @@
+import os
+import signal
+import time
+from http import HTTPStatus
+from socket import *
+
+from io_scheduler import sched
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, path, version, headers):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers      # Lower-case header name -> value
+        self.body = b''
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            self.keep_alive = connection != 'close'
+        else:
+            self.keep_alive = connection == 'keep-alive'
+
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        # Only plain digits: int() would also take '-40', '+5' or '1_0', and a negative length moves the parser back
+        length = headers.get('content-length', '0')
+        if not (length.isascii() and length.isdigit()):
+            raise HttpError(400, 'Bad Content-Length')
+        self.content_length = int(length)
+
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None, content_type='text/plain'):
+        self.body = body        # bytes, or an iterable of bytes chunks sent with chunked encoding
+        self.status = status
+        self.headers = headers or {}
+        self.content_type = content_type
+
+    def encode(self, keep_alive):
+        head = [f'HTTP/1.1 {self.status} {HTTPStatus(self.status).phrase}',
+                f'Content-Type: {self.content_type}',
+                'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+        head.extend(f'{name}: {value}' for name, value in self.headers.items())
+
+        if isinstance(self.body, (bytes, bytearray, memoryview)):
+            head.append(f'Content-Length: {len(self.body)}')
+            body = self.body
+        else:
+            head.append('Transfer-Encoding: chunked')
+            body = b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in self.body if chunk)
+            body += b'0\r\n\r\n'
+        return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+class HttpParser:
+    max_header_size = 65536
+    max_body_size = 1 << 20     # Larger bodies are refused with 413 instead of being buffered in memory
+
+    def __init__(self):
+        self.buffer = bytearray()    # One buffer per connection
+        self.pos = 0                 # Start of data that is not parsed yet
+        self.scan = 0                # Where to resume looking for the end of headers
+        self.request = None          # Request whose body is still being read
+        self.chunk_state = 'size'
+        self.chunk_size = 0
+        self.chunks = []
+        self.body_size = 0           # Sum of the chunks read so far
+
+    def feed(self, data):
+        if self.pos:
+            del self.buffer[:self.pos]     # Drop parsed requests once per recv, not per request
+            self.scan -= self.pos
+            self.pos = 0
+        self.buffer += data
+
+    def next_request(self):
+        if self.request is None:
+            end = self.buffer.find(b'\r\n\r\n', max(self.scan, self.pos))
+            if end < 0:
+                if len(self.buffer) - self.pos > self.max_header_size:
+                    raise HttpError(431)
+                self.scan = max(len(self.buffer) - 3, self.pos)
+                return None
+            self.request = self._parse_head(bytes(self.buffer[self.pos:end]))
+            self.pos = end + 4
+            if self.request.content_length > self.max_body_size:
+                raise HttpError(413)
+
+        if self.request.chunked:
+            done = self._read_chunks()
+        else:
+            done = self._read_length()
+        if not done:
+            return None
+
+        request, self.request = self.request, None
+        self.scan = self.pos
+        return request
+
+    def _parse_head(self, head):
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise HttpError(400, 'Bad request line')
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HttpError(400, 'Bad header line')
+            headers[name.strip().lower()] = value.strip()
+        return Request(parts[0], parts[1], parts[2], headers)
+
+    def _read_length(self):
+        size = self.request.content_length
+        if len(self.buffer) - self.pos < size:
+            return False
+        self.request.body = bytes(self.buffer[self.pos:self.pos + size])
+        self.pos += size
+        return True
+
+    def _read_chunks(self):
+        while True:
+            if self.chunk_state == 'data':
+                if len(self.buffer) - self.pos < self.chunk_size + 2:
+                    return False
+                end = self.pos + self.chunk_size
+                if self.buffer[end:end + 2] != b'\r\n':
+                    raise HttpError(400, 'Bad chunk')
+                self.chunks.append(bytes(self.buffer[self.pos:end]))
+                self.pos = end + 2
+                self.chunk_state = 'size'
+                continue
+
+            end = self.buffer.find(b'\r\n', self.pos)
+            if end < 0:
+                if len(self.buffer) - self.pos > self.max_header_size:
+                    raise HttpError(400, 'Chunk line too long')
+                return False
+            line = bytes(self.buffer[self.pos:end])
+            self.pos = end + 2
+
+            if self.chunk_state == 'size':
+                size = line.split(b';')[0].strip()
+                if not size or size.strip(b'0123456789abcdefABCDEF'):
+                    raise HttpError(400, 'Bad chunk size')
+                self.chunk_size = int(size, 16)
+                self.body_size += self.chunk_size
+                if self.body_size > self.max_body_size:
+                    raise HttpError(413)
+                self.chunk_state = 'data' if self.chunk_size else 'trailer'
+            elif not line:      # Empty line ends the trailer section
+                self.request.body = b''.join(self.chunks)
+                self.chunks = []
+                self.body_size = 0
+                self.chunk_state = 'size'
+                return True
+
+
+async def http_connection(sock, handler):
+    parser = HttpParser()
+    out = bytearray()
+    keep_alive = True
+    try:
+        while keep_alive:
+            data = await sched.recv(sock, 65536)
+            if not data:
+                break
+            try:
+                parser.feed(data)
+                # Answer every pipelined request already in the buffer
+                while (request := parser.next_request()) is not None:
+                    try:
+                        response = await handler(request)
+                    except Exception:
+                        response = Response(status=500)
+                    keep_alive = request.keep_alive
+                    out += response.encode(keep_alive)
+                    if not keep_alive:
+                        break
+            except HttpError as e:
+                out += Response(str(e).encode(), status=e.status).encode(False)
+                keep_alive = False
+
+            while out:      # All responses of the batch go out in as few writes as possible
+                sent = await sched.send(sock, out)
+                del out[:sent]
+    except OSError:
+        pass        # Client reset the connection, only this connection is dropped
+    finally:
+        sock.close()
+
+
+async def http_server(addr, handler, backlog=128, max_accept=64):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    while True:
+        for client, _ in await sched.accept_many(sock, max_accept):
+            sched.new_task(http_connection(client, handler))
+
+
+async def hello(request):
+    if request.method == 'POST':
+        return Response(b'Got:' + request.body)
+    return Response(b'Hello, world!')
+
+
+def _serve_http_server(port):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True    # Headers and body go out in separate writes
+
+        def do_GET(self):
+            body = b'Hello, world!'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer(('127.0.0.1', port), Handler).serve_forever()
+
+
+async def _echo_connection(sock):
+    # Baseline without parsing: one canned reply per end of headers seen in the stream
+    reply = Response(b'Hello, world!').encode(True)
+    tail = b''
+    while True:
+        data = await sched.recv(sock, 65536)
+        if not data:
+            break
+        count = (tail + data).count(b'\r\n\r\n')
+        tail = data[-3:]
+        out = reply * count
+        while out:
+            sent = await sched.send(sock, out)
+            out = out[sent:]
+    sock.close()
+
+
+async def _echo_server(addr):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(128)
+    sock.setblocking(False)
+    while True:
+        for client, _ in await sched.accept_many(sock, 64):
+            sched.new_task(_echo_connection(client))
+
+
+def _serve_scheduler(server, *args):
+    sched.new_task(server(*args))
+    sched.run()
+
+
+def _in_child(target, *args):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            target(*args)
+        finally:
+            os._exit(0)
+    time.sleep(0.3)     # Let the server start listening
+    return pid
+
+
+def _client(port, request, total, depth):
+    sock = create_connection(('127.0.0.1', port))
+    sock.sendall(request)
+    time.sleep(0.1)                   # Let the whole first reply arrive
+    reply = len(sock.recv(65536))     # Every reply has the same size
+    start = time.perf_counter()
+    expected = 0
+    for _ in range(total // depth):
+        sock.sendall(request * depth)    # Pipelined batch
+        expected += reply * depth
+        while expected > 0:
+            expected -= len(sock.recv(65536))
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return total / elapsed
+
+
+def bench(total=20000, depth=16):
+    request = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+    servers = [
+        ('io_scheduler http', 30003, _serve_scheduler, (http_server, ('127.0.0.1', 30003), hello)),
+        ('http.server', 30004, _serve_http_server, (30004,)),
+        ('echo baseline', 30005, _serve_scheduler, (_echo_server, ('127.0.0.1', 30005))),
+    ]
+    for name, port, target, args in servers:
+        pid = _in_child(target, *args)
+        try:
+            print(f'{name:>18}: {_client(port, request, total, depth):.0f} requests/sec')
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    HTTP/1.1 сервер на основе планировщика из файла io_scheduler.py.
+
+    HttpParser - инкрементальный разборщик запросов. Данные, пришедшие из сокета, дописываются методом feed() в один
+    буфер на все соединение. Метод next_request() возвращает очередной полностью пришедший запрос или None, если данных
+    пока не хватает. Чтобы не копировать буфер после каждого запроса, разобранная часть отмечается смещением self.pos,
+    а удаляется из буфера только один раз при следующем feed(). Конец заголовков (пустая строка) ищется не с начала
+    буфера, а с того места, где поиск остановился в прошлый раз (self.scan).
+    Тело запроса читается либо по заголовку Content-Length, либо по частям (Transfer-Encoding: chunked): размер части
+    в шестнадцатеричном виде, сама часть, и так до части нулевого размера и пустой строки после нее.
+    Content-Length должен состоять только из цифр, а размер части - только из шестнадцатеричных цифр, иначе
+    выбрасывается HttpError(400). int() принял бы и '-40': отрицательная длина сдвинула бы self.pos назад, и одни и
+    те же заголовки разбирались бы снова и снова в бесконечном цикле.
+    Тело больше max_body_size (по Content-Length или по сумме частей) не читается в память - клиенту отвечают 413.
+
+    Request - разобранный запрос. keep_alive показывает, нужно ли оставить соединение открытым после ответа:
+    в HTTP/1.1 соединение остается открытым, пока клиент не пришлет Connection: close, а в HTTP/1.0 наоборот.
+
+    Response - ответ обработчика. Если тело ответа не bytes, а итерируемый объект из частей, то ответ отправляется по
+    частям (chunked).
+
+    http_connection - обслуживает одно соединение. Клиент может отправить несколько запросов подряд, не дожидаясь
+    ответов (pipelining). Поэтому после каждого recv() обрабатываются все запросы, которые уже целиком есть в буфере,
+    ответы на них складываются в один буфер out и отправляются вместе, а не отдельным send() на каждый запрос.
+    При ошибке разбора клиенту отправляется ответ с кодом ошибки и соединение закрывается. Ошибка сокета (клиент
+    сбросил соединение) закрывает только это соединение, а не выходит из sched.run(), как в rpc._Connection.
+
+    bench - Сравнивает число запросов в секунду у этого сервера, у стандартного http.server и у эхо-сервера, который
+    не разбирает HTTP вовсе, а на каждый конец заголовков в потоке отвечает заранее готовым ответом. Каждый сервер запускается в дочернем процессе, а клиент отправляет запросы пачками.
+"""
@@ -1,4 +1,8 @@
+import os
+import errno
 import time
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from collections import deque
 import heapq
 from select import select
@@ -9,16 +13,73 @@ class Scheduler:
         self.ready = deque()     # Functions ready to execute
         self.sleeping = []       # Sleeping functions
         self.sequence = 0 
+        self._cancelled = set()  # Sequence numbers of cancelled timers still in the heap
+        self.current = None      # Task being executed, None outside of a task step
         self._read_waiting = { }
         self._write_waiting = { }
+        self.process_pool = None        # Created on the first run_in_process()
+        self.thread_pool = None         # Created on the first run_in_thread()
+        self.thread_workers = 4
+        self._process_done = deque()    # Tasks whose process results are ready
+        self._process_pending = 0
+        self._wakeup_read = self._wakeup_write = None
+        self.virtual_time = None        # Simulated clock, None means real time
+        self.tracer = None              # Optional tracing.Tracer
+        self.watchdog = None            # Optional watchdog.Watchdog
+        self.gc_control = None          # Optional gc_control.GCControl
+        self.busy_poll = 0.0            # Longest spin before blocking in select(), 0 disables
+        self.eager = False              # new_task() runs the coroutine right away, up to its first wait
+        self._spin = 0.0                # Current spin window, tuned by _poll()
+        self.spin_hits = 0
+        self.spin_misses = 0
+        # Counters for stats(), plain integer additions so they can stay on all the time
+        self.iterations = 0
+        self.tasks_created = 0
+        self.tasks_finished = 0
+        self.select_calls = 0
+        self.select_wait = 0.0          # Total seconds spent blocked in select()
+
+    def clock(self):
+        if self.virtual_time is None:
+            return time.time()
+        return self.virtual_time
 
     def call_soon(self, func):
         self.ready.append(func)
 
     def call_later(self, delay, func):
         self.sequence += 1
-        deadline = time.time() + delay     # Expiration time
-        heapq.heappush(self.sleeping, (deadline, self.sequence, func))
+        deadline = self.clock() + delay     # Expiration time
+        timer = (deadline, self.sequence, func)
+        heapq.heappush(self.sleeping, timer)
+        return timer
+
+    def cancel_later(self, timer):
+        # Drop a timer returned by call_later(), so run() does not wait for it. No-op if it already fired.
+        # Only marked here: removing it from the middle of the heap costs O(n), so it is skipped once it reaches the top.
+        sleeping = self.sleeping
+        if not sleeping:
+            return
+        if sleeping[0] is timer:
+            heapq.heappop(sleeping)
+            self._drop_cancelled()
+            return
+        cancelled = self._cancelled
+        cancelled.add(timer[1])
+        if len(cancelled) > 64 and len(cancelled) * 2 > len(sleeping):
+            # Mostly dead entries, rebuild the heap without them
+            sleeping[:] = [entry for entry in sleeping if entry[1] not in cancelled]
+            heapq.heapify(sleeping)
+            cancelled.clear()
+
+    def _drop_cancelled(self):
+        # Keeps the top of the heap a live timer, so run() neither waits for nor stays alive because of cancelled ones
+        sleeping = self.sleeping
+        cancelled = self._cancelled
+        while sleeping and sleeping[0][1] in cancelled:
+            cancelled.discard(heapq.heappop(sleeping)[1])
+        if not sleeping:
+            cancelled.clear()       # Marks of timers that had already fired when cancelled
 
     def read_wait(self, fileno, func):
         self._read_waiting[fileno] = func   # Trigger func() when fileno is readable
@@ -28,7 +89,13 @@ class Scheduler:
 
     def run(self):
         while (self.ready or self.sleeping or self._read_waiting or self._write_waiting):
-            if not self.ready:
+            tracer = self.tracer
+            self.iterations += 1
+            watchdog = self.watchdog
+            gc_control = self.gc_control
+            if not self.ready and self.virtual_time is not None:
+                self._advance_virtual_time()
+            elif not self.ready:
                 # Find the nearest deadline
                 if self.sleeping:
                     deadline, _, func = self.sleeping[0]
@@ -39,7 +106,19 @@ class Scheduler:
                     timeout = None     # Wait forever
 
                 # Wait for I/O (and sleep)
-                can_read, can_write, _ = select(self._read_waiting, self._write_waiting, [], timeout)
+                if gc_control and timeout != 0:
+                    gc_control.idle(timeout, self._read_waiting, self._write_waiting)
+                if watchdog:
+                    watchdog.idle()     # Waiting in select() is not lag
+                start = time.perf_counter()
+                if self.busy_poll:
+                    can_read, can_write = self._poll(timeout)
+                else:
+                    can_read, can_write, _ = select(self._read_waiting, self._write_waiting, [], timeout)
+                self.select_calls += 1
+                self.select_wait += time.perf_counter() - start
+                if tracer:
+                    tracer.select(start, len(can_read), len(can_write))
 
                 for fd in can_read:
                     self.ready.append(self._read_waiting.pop(fd))
@@ -51,15 +130,100 @@ class Scheduler:
                 while self.sleeping:
                     if now > self.sleeping[0][0]:
                         self.ready.append(heapq.heappop(self.sleeping)[2])
+                        if self._cancelled:
+                            self._drop_cancelled()
+                        if tracer:
+                            tracer.instant('timer expired')
                     else:
                         break
 
-            while self.ready:
-                func = self.ready.popleft()
-                func()
+            if watchdog:
+                watchdog.beat()
+            if gc_control:
+                gc_control.busy()
+            if tracer:
+                tracer.run_ready(self.ready)
+            else:
+                while self.ready:
+                    func = self.ready.popleft()
+                    func()
+
+        if self.watchdog:
+            self.watchdog.idle()    # Count the last iteration, and whatever runs after run() is not loop lag
+
+    def _poll(self, timeout):
+        # Spin with select(..., 0) for a while before blocking, the next event often comes in microseconds
+        spin = self._spin
+        if spin and timeout != 0 and (self._read_waiting or self._write_waiting):
+            start = now = time.perf_counter()
+            end = start + (spin if timeout is None else min(spin, timeout))
+            while now < end:
+                can_read, can_write, _ = select(self._read_waiting, self._write_waiting, [], 0)
+                if can_read or can_write:
+                    self.spin_hits += 1
+                    self._spin = min(spin * 2, self.busy_poll)
+                    return can_read, can_write
+                now = time.perf_counter()
+            self.spin_misses += 1
+            if timeout is not None:
+                timeout = max(timeout - (now - start), 0)
+
+        start = time.perf_counter()
+        can_read, can_write, _ = select(self._read_waiting, self._write_waiting, [], timeout)
+        waited = time.perf_counter() - start
+        if (can_read or can_write) and waited < self.busy_poll:
+            # A slightly longer spin would have caught this event
+            self._spin = min(max(spin * 2, self.busy_poll / 16), self.busy_poll)
+        elif spin:
+            # Spinning was wasted, shrink the window and stop spinning when it gets too small
+            spin /= 2
+            self._spin = spin if spin >= self.busy_poll / 16 else 0.0
+        return can_read, can_write
+
+    def _advance_virtual_time(self):
+        # Simulation: waiting keys are fake sockets (simulation.FakeSocket), not OS descriptors
+        can_read = [sock for sock in self._read_waiting if sock.readable()]
+        can_write = [sock for sock in self._write_waiting if sock.writable()]
+        for sock in can_read:
+            self.ready.append(self._read_waiting.pop(sock))
+        for sock in can_write:
+            self.ready.append(self._write_waiting.pop(sock))
+        if self.ready:
+            return
+
+        if not self.sleeping:
+            raise RuntimeError('Simulation deadlock: tasks wait for I/O that never comes')
+        self.virtual_time = max(self.virtual_time, self.sleeping[0][0])     # Jump to the next deadline
+        while self.sleeping and self.sleeping[0][0] <= self.virtual_time:
+            self.ready.append(heapq.heappop(self.sleeping)[2])
+            if self._cancelled:
+                self._drop_cancelled()
 
     def new_task(self, coro):
-        self.ready.append(Task(coro))   # Wrapped coroutine
+        self.tasks_created += 1
+        if not self.eager:
+            self.ready.append(Task(coro))   # Wrapped coroutine
+            return
+        # Eager start: a task that finishes without waiting never goes through the ready queue
+        current = self.current
+        Task(coro)()
+        self.current = current      # new_task() may be called from a running task
+
+    def stats(self):
+        return {
+            'ready': len(self.ready),
+            'sleeping': len(self.sleeping),
+            'read_waiting': len(self._read_waiting),
+            'write_waiting': len(self._write_waiting),
+            'iterations': self.iterations,
+            'tasks_created': self.tasks_created,
+            'tasks_finished': self.tasks_finished,
+            'tasks_alive': self.tasks_created - self.tasks_finished,
+            'select_calls': self.select_calls,
+            'select_wait_avg': self.select_wait / self.select_calls if self.select_calls else 0.0,
+            'spin_hits': self.spin_hits,
+            'spin_misses': self.spin_misses,
+        }
 
     async def sleep(self, delay):
         self.call_later(delay, self.current)
@@ -84,6 +248,290 @@ class Scheduler:
         await switch()
         return sock.accept()
 
+    async def accept_many(self, sock, limit):
+        # sock must be non-blocking: drain up to limit pending connections per wakeup
+        self.read_wait(sock, self.current)
+        self.current = None
+        await switch()
+        clients = []
+        while len(clients) < limit:
+            try:
+                clients.append(sock.accept())
+            except BlockingIOError:
+                break
+        return clients
+
+    async def connect(self, sock, addr):
+        # sock must be non-blocking: wait for writability while the connection is in progress
+        delay = 0.0
+        while True:
+            try:
+                sock.connect(addr)
+                return
+            except BlockingIOError as exc:
+                if exc.errno != errno.EAGAIN:
+                    break           # EINPROGRESS: the connection completes in the background
+            # EAGAIN (AF_UNIX with a full backlog): nothing is in progress, connect() has to be repeated.
+            # An unconnected Unix socket is writable at once, so later attempts back off instead of spinning.
+            if delay:
+                await self.sleep(delay)
+            self.write_wait(sock, self.current)
+            self.current = None
+            await switch()
+            delay = min(delay * 2 or 0.001, 0.05)
+
+        self.write_wait(sock, self.current)
+        self.current = None
+        await switch()
+        err = sock.getsockopt(SOL_SOCKET, SO_ERROR)
+        if err:
+            raise OSError(err, f'Connect call failed {addr}')
+
+    async def recvfrom(self, sock, maxbytes):
+        self.read_wait(sock, self.current)
+        self.current = None
+        await switch()
+        return sock.recvfrom(maxbytes)
+
+    async def sendto(self, sock, data, addr):
+        self.write_wait(sock, self.current)
+        self.current = None
+        await switch()
+        return sock.sendto(data, addr)
+
+    async def recvfrom_many(self, sock, ring):
+        # sock must be non-blocking: drain all queued datagrams into the ring per wakeup
+        self.read_wait(sock, self.current)
+        self.current = None
+        await switch()
+        return ring.fill(sock)
+
+    async def sendto_many(self, sock, datagrams):
+        # sock must be non-blocking: send as many (data, addr) pairs as fit per wakeup
+        sent = 0
+        while sent < len(datagrams):
+            self.write_wait(sock, self.current)
+            self.current = None
+            await switch()
+            while sent < len(datagrams):
+                data, addr = datagrams[sent]
+                try:
+                    sock.sendto(data, addr)
+                except BlockingIOError:
+                    break
+                sent += 1
+        return sent
+
+    async def read(self, fd, maxbytes):
+        # Same as recv() for pipes and other raw file descriptors
+        self.read_wait(fd, self.current)
+        self.current = None
+        await switch()
+        return os.read(fd, maxbytes)
+
+    async def write(self, fd, data):
+        self.write_wait(fd, self.current)
+        self.current = None
+        await switch()
+        return os.write(fd, data)
+
+    async def subprocess_exec(self, *args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, **kwargs):
+        return Process(subprocess.Popen(args, stdin=stdin, stdout=stdout, stderr=stderr, **kwargs))
+
+    async def run_in_process(self, func, *args):
+        return await self.wait_future(self._get_process_pool().submit(func, *args))
+
+    async def map_in_process(self, func, iterable, chunksize=1):
+        # One submission and one result per chunk instead of per item
+        items = list(iterable)
+        pool = self._get_process_pool()
+        futures = [pool.submit(_process_chunk, func, items[n:n + chunksize])
+                   for n in range(0, len(items), chunksize)]
+        results = []
+        for future in futures:
+            results.extend(await self.wait_future(future))
+        return results
+
+    async def run_in_thread(self, func, *args):
+        # For blocking calls that release the GIL (file I/O), the result is waited for like a process result
+        return await self.wait_future(self.submit_to_thread(func, *args))
+
+    def submit_to_thread(self, func, *args):
+        # Starts func in the thread pool without waiting, the future can be awaited later with wait_future()
+        return self._get_thread_pool().submit(func, *args)
+
+    def _get_process_pool(self):
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor()
+        self._get_wakeup()
+        return self.process_pool
+
+    def _get_thread_pool(self):
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor(self.thread_workers)
+        self._get_wakeup()
+        return self.thread_pool
+
+    def _get_wakeup(self):
+        if self._wakeup_read is None:
+            self._wakeup_read, self._wakeup_write = os.pipe()
+            os.set_blocking(self._wakeup_read, False)
+            os.set_blocking(self._wakeup_write, False)
+
+    async def wait_future(self, future):
+        # Sleeps until a concurrent.futures.Future from any executor or thread is done, returns its result
+        self._get_wakeup()
+        task = self.current
+        self.current = None
+        self._process_pending += 1
+        if self._process_pending == 1:
+            self.read_wait(self._wakeup_read, self._wake_process_tasks)
+        future.add_done_callback(lambda f: self._notify_process_done(task))
+        await switch()
+        return future.result()
+
+    def _notify_process_done(self, task):
+        # Runs in the executor's thread: hand the task over and wake select()
+        self._process_done.append(task)
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except BlockingIOError:
+            pass      # Pipe is full, select() will wake up anyway
+
+    def _wake_process_tasks(self):
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._process_done:
+            self.ready.append(self._process_done.popleft())
+            self._process_pending -= 1
+        if self._process_pending:
+            self.read_wait(self._wakeup_read, self._wake_process_tasks)
+
+
+def _process_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+class Process:
+    def __init__(self, popen):
+        self.popen = popen
+        self.pid = popen.pid
+        self.returncode = None
+        self.stdin = self._fileno(popen.stdin)     # Non-blocking pipe fds, or None
+        self.stdout = self._fileno(popen.stdout)
+        self.stderr = self._fileno(popen.stderr)
+
+    @staticmethod
+    def _fileno(pipe):
+        if pipe is None:
+            return None
+        os.set_blocking(pipe.fileno(), False)
+        return pipe.fileno()
+
+    async def read(self, maxbytes=65536):
+        return await sched.read(self.stdout, maxbytes)
+
+    async def read_stderr(self, maxbytes=65536):
+        return await sched.read(self.stderr, maxbytes)
+
+    async def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = await sched.write(self.stdin, view)
+            view = view[written:]
+
+    def close_stdin(self):
+        if self.popen.stdin:
+            self.popen.stdin.close()
+            self.stdin = None
+
+    async def wait(self):
+        if self.returncode is not None:
+            return self.returncode
+        if hasattr(os, 'pidfd_open'):
+            pidfd = os.pidfd_open(self.pid)     # Becomes readable when the child exits
+            try:
+                sched.read_wait(pidfd, sched.current)
+                sched.current = None
+                await switch()
+            finally:
+                os.close(pidfd)
+        else:
+            while self.popen.poll() is None:
+                await sched.sleep(0.05)
+        self.returncode = self.popen.wait()   # Reap without blocking, the child has exited
+        return self.returncode
+
+    async def communicate(self, input=None):
+        output = {}
+        waiter = []
+        remaining = 0
+
+        def done():
+            nonlocal remaining
+            remaining -= 1
+            if not remaining and waiter:
+                sched.ready.append(waiter.pop())
+
+        async def drain(name, fd):
+            chunks = []
+            while True:
+                data = await sched.read(fd, 65536)
+                if not data:
+                    break
+                chunks.append(data)
+            output[name] = b''.join(chunks)
+            done()
+
+        async def feed():
+            try:
+                if input:
+                    await self.write(input)
+            except BrokenPipeError:
+                pass       # Child exited without reading all of its input
+            self.close_stdin()
+            done()
+
+        if self.stdin is not None:
+            remaining += 1
+            sched.new_task(feed())
+        for name, fd in (('stdout', self.stdout), ('stderr', self.stderr)):
+            if fd is not None:
+                remaining += 1
+                sched.new_task(drain(name, fd))
+
+        if remaining:
+            waiter.append(sched.current)     # Sleep until every pipe is done
+            sched.current = None
+            await switch()
+
+        await self.wait()
+        return output.get('stdout'), output.get('stderr')
+
+
+class DatagramRing:
+    def __init__(self, count=64, size=2048):
+        self.buffer = bytearray(count * size)     # Allocated once, reused for every datagram
+        view = memoryview(self.buffer)
+        self.slots = [view[n * size:(n + 1) * size] for n in range(count)]
+        self.pos = 0
+
+    def fill(self, sock):
+        datagrams = []
+        while len(datagrams) < len(self.slots):
+            slot = self.slots[self.pos]
+            try:
+                nbytes, addr = sock.recvfrom_into(slot)
+            except BlockingIOError:
+                break
+            self.pos = (self.pos + 1) % len(self.slots)
+            datagrams.append((slot[:nbytes], addr))
+        return datagrams
+
 
 class Task:
     def __init__(self, coro):
@@ -97,7 +545,7 @@ class Task:
             if sched.current:
                 sched.ready.append(self)
         except StopIteration:
-            pass
+            sched.tasks_finished += 1
 
 
 class Awaitable:
@@ -112,15 +560,267 @@ def switch():
 sched = Scheduler()    # Background scheduler object
 
 
+class Lock:
+    def __init__(self):
+        self._locked = False
+        self.waiting = deque()    # Tasks waiting for the lock
+
+    def locked(self):
+        return self._locked
+
+    async def acquire(self):
+        if self._locked:
+            self.waiting.append(sched.current)   # Put myself to sleep
+            sched.current = None
+            await switch()      # Woken up already owning the lock
+        else:
+            self._locked = True
+
+    def release(self):
+        if not self._locked:
+            raise RuntimeError('Lock is not acquired')
+        if self.waiting:
+            sched.ready.append(self.waiting.popleft())   # Hand the lock over, it stays locked
+        else:
+            self._locked = False
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class Event:
+    def __init__(self):
+        self._set = False
+        self.waiting = deque()
+
+    def is_set(self):
+        return self._set
+
+    def set(self):
+        self._set = True
+        sched.ready.extend(self.waiting)    # Wake everybody
+        self.waiting.clear()
+
+    def clear(self):
+        self._set = False
+
+    async def wait(self):
+        if not self._set:
+            self.waiting.append(sched.current)
+            sched.current = None
+            await switch()
+        return True
+
+
+class Semaphore:
+    def __init__(self, value=1):
+        if value < 0:
+            raise ValueError('Semaphore initial value must be >= 0')
+        self.value = value
+        self.waiting = deque()
+
+    def locked(self):
+        return self.value == 0
+
+    async def acquire(self):
+        if self.value:
+            self.value -= 1
+        else:
+            self.waiting.append(sched.current)
+            sched.current = None
+            await switch()      # Woken up already holding the slot
+
+    def acquire_nowait(self, count=1):
+        # Takes up to count free slots without sleeping, returns how many were taken
+        taken = min(count, self.value)
+        self.value -= taken
+        return taken
+
+    def release(self):
+        if self.waiting:
+            sched.ready.append(self.waiting.popleft())   # Hand the slot over
+        else:
+            self.value += 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class BoundedSemaphore(Semaphore):
+    def __init__(self, value=1):
+        super().__init__(value)
+        self.bound = value
+
+    def release(self):
+        if not self.waiting and self.value >= self.bound:
+            raise ValueError('BoundedSemaphore released too many times')
+        super().release()
+
+
+class Condition:
+    def __init__(self, lock=None):
+        self.lock = lock or Lock()
+        self.waiting = deque()
+
+    async def wait(self):
+        if not self.lock.locked():
+            raise RuntimeError('Cannot wait on an un-acquired lock')
+        self.waiting.append(sched.current)
+        sched.current = None
+        self.lock.release()
+        await switch()
+        await self.lock.acquire()
+
+    async def wait_for(self, predicate):
+        while not predicate():
+            await self.wait()
+        return True
+
+    def notify(self, n=1):
+        while self.waiting and n:
+            sched.ready.append(self.waiting.popleft())
+            n -= 1
+
+    def notify_all(self):
+        self.notify(len(self.waiting))
+
+    async def __aenter__(self):
+        await self.lock.acquire()
+
+    async def __aexit__(self, *exc):
+        self.lock.release()
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class _TimedWaiter:
+    def __init__(self, task):
+        self.task = task
+        self.timer = None
+        self.woken = False          # Woken by put() or close(), the timer must not fire anymore
+        self.timed_out = False
+
+    def __call__(self):
+        self.task()
+
+
+class AsyncQueue:
+    def __init__(self, maxsize=0):
+        self.items = deque()
+        self.waiting = deque()      # Getters waiting for data
+        self.putters = deque()      # Putters waiting for free space
+        self.maxsize = maxsize      # 0 means unbounded
+        self._closed = False
+        self.exc = None             # Raised to getters instead of QueueClosed
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self, exc=None):
+        self._closed = True
+        self.exc = exc
+        for waiter in self.waiting:         # Getters raise once the items run out
+            self._wake(waiter)
+        sched.ready.extend(self.putters)
+        self.waiting.clear()
+        self.putters.clear()
+
+    async def put(self, item):
+        while self.maxsize and len(self.items) >= self.maxsize and not self._closed:
+            self.putters.append(sched.current)
+            sched.current = None
+            await switch()
+        if self._closed:
+            raise QueueClosed()
+
+        self.items.append(item)
+        if self.waiting:
+            self._wake(self.waiting.popleft())
+            if sched.tracer:
+                sched.tracer.instant('queue wakeup')
+
+    async def get(self, timeout=None):
+        deadline = None if timeout is None else sched.clock() + timeout
+        while not self.items:
+            if self._closed:
+                raise self.exc or QueueClosed()
+            if deadline is None:
+                self.waiting.append(sched.current)
+                sched.current = None
+                await switch()
+            else:
+                waiter = _TimedWaiter(sched.current)
+                self.waiting.append(waiter)
+                waiter.timer = sched.call_later(deadline - sched.clock(), lambda: self._expire(waiter))
+                sched.current = None
+                await switch()
+                if waiter.timed_out:
+                    raise TimeoutError()
+
+        if self.putters:
+            sched.ready.append(self.putters.popleft())
+        return self.items.popleft()
+
+    def _wake(self, waiter):
+        if type(waiter) is _TimedWaiter:
+            waiter.woken = True
+            sched.cancel_later(waiter.timer)
+        sched.ready.append(waiter)
+
+    def _expire(self, waiter):
+        # The timer may already be out of the heap when put() wakes the waiter in the same iteration
+        if not waiter.woken:
+            self.waiting.remove(waiter)
+            waiter.timed_out = True
+            sched.ready.append(waiter)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except QueueClosed:
+            raise StopAsyncIteration
+
+
 from socket import *
-async def tcp_server(addr):
+async def tcp_server(addr, backlog=128, max_accept=64, max_connections=None):
     sock = socket(AF_INET, SOCK_STREAM)
     sock.bind(addr)
-    sock.listen(1)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    slots = Semaphore(max_connections) if max_connections else None
+
+    async def serve(client):
+        try:
+            await echo_handler(client)
+        finally:
+            if slots:
+                slots.release()
+
     while True:
-        client, addr = await sched.accept(sock)
-        print('Connection from', addr)
-        sched.new_task(echo_handler(client))
+        limit = max_accept
+        if slots:
+            await slots.acquire()      # Sleeps while max_connections are open
+            limit = 1 + slots.acquire_nowait(max_accept - 1)
+
+        clients = await sched.accept_many(sock, limit)
+        if slots:
+            for _ in range(limit - len(clients)):
+                slots.release()     # Slots taken for connections that didn't come
+
+        for client, client_addr in clients:
+            print('Connection from', client_addr)
+            sched.new_task(serve(client))
 
 
 """
@@ -130,6 +830,15 @@ async def tcp_server(addr):
     создав новый сокет для общения с подключившимся клиентом. Возвращает новый сокет и адрес клиента, выводит адрес в
     консоль и передает планировщику новую задачу - корутину echo_handler, в которую передает новый, созданный для общения
     с клиентом сокет.
+
+    Серверный сокет переводится в неблокирующий режим, а очередь ожидающих подключений (backlog) задается аргументом,
+    вместо прежнего listen(1), при котором во время наплыва клиентов часть запросов на подключение отбрасывалась.
+    За одно пробуждение корутина принимает сразу до max_accept подключений (метод accept_many), а не одно.
+    Если задан max_connections, то число открытых соединений ограничивается семафором slots. Перед приемом подключений
+    корутина занимает место в семафоре, и если все места заняты, засыпает, не нагружая цикл. Каждое закрытое
+    соединение освобождает место и будит сервер, если тот спит. За одно пробуждение принимается не больше подключений,
+    чем есть свободных мест: сервер заранее занимает их методом acquire_nowait(), а неиспользованные возвращает
+    через release(), так что счетчик семафора меняется только его методами.
 """
 
 async def echo_handler(sock):
@@ -149,8 +858,27 @@ async def echo_handler(sock):
     соединения и закрывает соединение у сокета, созданного для общения с клиентом.
 """
 
-sched.new_task(tcp_server(('', 30000)))
-sched.run()
+async def udp_echo_server(addr):
+    sock = socket(AF_INET, SOCK_DGRAM)
+    sock.bind(addr)
+    sock.setblocking(False)
+    ring = DatagramRing()
+    while True:
+        datagrams = await sched.recvfrom_many(sock, ring)
+        await sched.sendto_many(sock, [(b'Got:' + data, addr) for data, addr in datagrams])
+
+
+"""
+    Корутина udp_echo_server принимает UDP датаграммы и отправляет их обратно с добавлением строки 'Got:' в начале.
+    За одно пробуждение она забирает из сокета все пришедшие датаграммы и за одно пробуждение на запись отправляет
+    все ответы, а не по одной датаграмме за итерацию цикла планировщика.
+"""
+
+
+if __name__ == '__main__':
+    sched.new_task(tcp_server(('', 30000)))
+    sched.new_task(udp_echo_server(('', 30001)))
+    sched.run()
 
 
 """
@@ -220,4 +948,111 @@ sched.run()
 
     accept() - Работает по тому же принципу что и метод recv(), только задействует серверный сокет для принятия подключения
     от клиентского сокета.
+
+    accept_many() - Тоже самое что и accept(), только после пробуждения принимает не одно подключение, а все ожидающие
+    в очереди серверного сокета, но не больше limit. Серверный сокет должен быть неблокирующим: когда ожидающих
+    подключений больше нет, sock.accept() выбрасывает BlockingIOError и цикл приема завершается. Так при наплыве клиентов
+    на каждого из них не тратится отдельная итерация цикла планировщика.
+
+    connect() - Подключает неблокирующий сокет к адресу. Если подключение не может завершиться сразу, то сокет
+    кладется в очередь ожидающих записи: сокет становится готовым к записи, когда подключение установлено или не удалось.
+    После пробуждения ошибка подключения считывается опцией сокета SO_ERROR.
+    У Unix сокетов (AF_UNIX) при заполненной очереди ожидающих подключений connect() выбрасывает не EINPROGRESS, а
+    EAGAIN: подключение при этом вообще не начато, и ждать его завершения бесполезно. В этом случае connect()
+    повторяется после пробуждения на запись. Неподключенный Unix сокет готов к записи сразу, поэтому между
+    повторными попытками задача засыпает на время, которое удваивается от 1 до 50 миллисекунд.
+
+    recvfrom() и sendto() - Тоже самое что и recv() и send(), только для UDP сокетов: вместе с данными возвращается или
+    передается адрес отправителя или получателя датаграммы.
+
+    recvfrom_many() - После пробуждения считывает из неблокирующего UDP сокета все пришедшие датаграммы, пока
+    sock.recvfrom_into() не выбросит BlockingIOError. Данные пишутся не в новые объекты bytes, а в заранее выделенные
+    ячейки кольцевого буфера DatagramRing. Возвращает список пар (memoryview на данные, адрес). Данные в ячейке
+    остаются верными, пока буфер не сделает полный круг, то есть пока не придут еще count датаграмм.
+
+    sendto_many() - Принимает список пар (данные, адрес). После пробуждения на запись отправляет столько датаграмм,
+    сколько сокет примет без блокировки, и если отправлены не все, снова ждет возможности записи.
+
+    read() и write() - Тоже самое что и recv() и send(), только для файловых дескрипторов (например каналов pipe),
+    поэтому данные читаются и пишутся функциями os.read() и os.write().
+
+    subprocess_exec() - Запускает дочерний процесс и возвращает объект Process. Каналы stdin, stdout и stderr процесса
+    переводятся в неблокирующий режим, а ожидание данных в них происходит через select() вместе с сокетами. Поэтому
+    пока внешняя программа работает, планировщик продолжает обслуживать остальные задачи, и одновременно может
+    работать сколько угодно дочерних процессов.
+
+    Process.wait() - Ждет завершения процесса. Для этого используется pidfd - файловый дескриптор процесса, который
+    становится готовым к чтению, когда процесс завершился. Его, как и сокет, кладут в очередь ожидающих чтения.
+    Там где pidfd нет, завершение процесса проверяется раз в 50 миллисекунд. После завершения код возврата забирается
+    вызовом popen.wait(), который уже не блокирует поток.
+
+    run_in_process() - Выполняет функцию func(*args) в отдельном процессе из пула ProcessPoolExecutor и возвращает ее
+    результат. Долгие вычисления в корутине блокируют весь планировщик, а потоки не помогают из-за GIL. В отдельных
+    процессах вычисления идут на других ядрах, а планировщик тем временем обслуживает сокеты.
+    Текущая задача засыпает, а когда результат готов, поток пула кладет задачу в self._process_done и пишет байт в
+    служебный канал pipe. Этот канал ожидает чтения в select() вместе с сокетами, поэтому select() просыпается, и
+    метод _wake_process_tasks переносит готовые задачи в очередь готовых. Канал ожидает чтения только пока есть
+    незавершенные задачи, иначе цикл планировщика никогда бы не закончился.
+
+    map_in_process() - Применяет func к каждому элементу, отправляя элементы в пул пачками по chunksize штук. Так на
+    множество мелких вызовов тратится меньше пересылок данных между процессами.
+
+    run_in_thread() - То же самое, но в пуле потоков ThreadPoolExecutor (thread_workers потоков). Подходит для
+    блокирующих вызовов, которые отпускают GIL, например чтения и записи файлов (files.py): процесс для них не нужен,
+    а данные не приходится пересылать между процессами. Пробуждение задачи идет через тот же служебный канал.
+
+    submit_to_thread() и wait_future() - те же два шага по отдельности: отправить вызов в пул потоков и получить
+    concurrent.futures.Future, а дождаться его позже (или дождаться Future, созданного где-то еще). Так FileReader из
+    files.py заранее запускает загрузку следующих кусков файла и ждет только тот, который нужен сейчас.
+
+    Режим виртуального времени. Если присвоить sched.virtual_time число (например 0.0), то планировщик перестает
+    смотреть на настоящие часы: время берется из self.virtual_time (метод clock()). Когда готовых задач нет, цикл не
+    ждет в select(), а сразу переводит часы на время пробуждения ближайшей спящей задачи (_advance_virtual_time).
+    Поэтому проверка того, что происходит за часы работы программы, занимает миллисекунды, а порядок выполнения задач
+    всегда одинаков: очередь готовых - это очередь FIFO, а задачи с одинаковым временем пробуждения упорядочены по
+    self.sequence. Вместо настоящих сокетов в этом режиме используются FakeSocket из файла simulation.py, их готовность
+    к чтению и записи проверяется без select(). Если все задачи ждут данных, которые никогда не придут, выбрасывается
+    RuntimeError.
+
+    Трассировка. Если присвоить sched.tracer объект Tracer из файла tracing.py, то цикл run() выполняет очередь
+    готовых через tracer.run_ready(), который записывает пачки готовых функций и выборку шагов. Кроме того
+    записываются время ожидания в select() с числом готовых сокетов, срабатывание таймеров и пробуждение задач
+    очередью AsyncQueue. Когда трассировка выключена, цикл выполняет готовые функции отдельной
+    веткой без проверок, поэтому ничего не теряет в скорости.
+
+    Lock, Event, Semaphore, BoundedSemaphore, Condition - примитивы синхронизации задач. Как и AsyncQueue.get() в файле
+    async_await/async_queue.py, они не проверяют условие в цикле, а кладут текущую задачу в очередь ожидающих
+    (self.waiting) и отдают контроль. Пробуждение - это перенос задачи из этой очереди в очередь готовых.
+
+    Lock - замок. release() при наличии ожидающих не открывает замок, а сразу передает его первой ожидающей задаче,
+    поэтому проснувшейся задаче не нужно снова проверять, свободен ли замок.
+
+    Event - событие. wait() усыпляет задачу, пока событие не установлено, а set() будит сразу всех ожидающих.
+
+    Semaphore - счетчик свободных мест. acquire() занимает место или засыпает, если мест нет, а release() передает
+    место первой ожидающей задаче или увеличивает счетчик. Так можно ограничить, например, число одновременных запросов
+    к базе данных. acquire_nowait(count) без ожидания занимает до count свободных мест и возвращает, сколько занял.
+    BoundedSemaphore выбрасывает ValueError, если мест освобождено больше, чем было изначально.
+
+    Condition - условная переменная. wait() отпускает замок и засыпает до вызова notify() или notify_all(), после чего
+    снова захватывает замок. wait_for(predicate) ждет, пока predicate() не вернет True.
+
+    AsyncQueue - Тоже самое что и очередь из файла async_await/async_queue_with_error.py, только с ограничением
+    размера. Если задан maxsize и очередь заполнена, put() засыпает в очереди self.putters, пока get() не заберет
+    элемент, поэтому быстрый производитель не может переполнить память. close() будит всех ожидающих, а если в него
+    передано исключение, то get() выбрасывает его вместо QueueClosed - так ошибка передается следующему потребителю.
+    get(timeout) выбрасывает TimeoutError, если за timeout секунд элемент не появился. Для этого в очередь
+    ожидающих кладется обертка _TimedWaiter и планируется вызов _expire(), который удаляет обертку из очереди
+    ожидающих и будит задачу с отметкой timed_out. Если put() или close() разбудили задачу раньше, то таймер
+    отменяется методом sched.cancel_later(): иначе он остался бы в очереди спящих, и run() не завершился бы, пока
+    таймер не сработает, а в режиме виртуального времени часы зря перевелись бы вперед. Отмена ленивая: удалить
+    элемент из середины кучи стоит O(n), поэтому cancel_later() только запоминает номер таймера в self._cancelled, а
+    отмененные таймеры выбрасываются, когда оказываются на вершине кучи (_drop_cancelled). Вершина кучи всегда живой
+    таймер, так что run() не ждет отмененных. Если отмененных больше половины кучи, она перестраивается без них. Отметка woken нужна на случай,
+    когда таймер уже вынут из очереди спящих, но его вызов стоит в очереди готовых после put(). Очередь поддерживает
+    async for.
+
+    Process.communicate() - Отправляет процессу данные, читает весь его вывод и ждет завершения. Запись в stdin и чтение
+    stdout и stderr идут в отдельных задачах, чтобы процесс не завис, заполнив один канал, пока мы пишем в другой.
+    Вызвавшая корутина засыпает, пока все три задачи не закончат работу.
 """
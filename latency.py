@@ -0,0 +1,102 @@
+import os
+import resource
+import time
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, IPPROTO_TCP, TCP_NODELAY
+
+from io_scheduler import sched
+
+
+async def _server(sock, clients):
+    for _ in range(clients):
+        client, _ = await sched.accept(sock)
+        client.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        sched.new_task(_echo(client))
+    sock.close()
+
+
+async def _echo(client):
+    while True:
+        data = await sched.recv(client, 100)
+        if not data:
+            break
+        await sched.send(client, data)
+    client.close()
+
+
+def _client(addr, count, gap, pipe):
+    # Plain blocking client in its own process: request, wait for the reply, think for `gap` seconds
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.connect(addr)
+    sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        sock.send(b'ping')
+        sock.recv(100)
+        samples.append(time.perf_counter() - start)
+        end = time.perf_counter() + gap
+        while time.perf_counter() < end:    # time.sleep() is too coarse for microseconds
+            pass
+    sock.close()
+    os.write(pipe, ' '.join(f'{s:.9f}' for s in samples).encode())
+    os.close(pipe)
+
+
+def measure(busy_poll, addr=('127.0.0.1', 30003), count=3000, gap=0.0002):
+    server = socket(AF_INET, SOCK_STREAM)
+    server.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    server.bind(addr)
+    server.listen(1)
+    read_end, write_end = os.pipe()
+    if os.fork() == 0:
+        os.close(read_end)
+        _client(addr, count, gap, write_end)
+        os._exit(0)
+    os.close(write_end)
+
+    sched.busy_poll = busy_poll
+    cpu = resource.getrusage(resource.RUSAGE_SELF)
+    sched.new_task(_server(server, 1))
+    sched.run()
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    sched.busy_poll = 0.0
+
+    data = b''
+    while chunk := os.read(read_end, 65536):
+        data += chunk
+    os.close(read_end)
+    os.wait()
+    samples = sorted(float(s) for s in data.split())
+    cpu_time = used.ru_utime + used.ru_stime - cpu.ru_utime - cpu.ru_stime
+    return samples[len(samples) // 2], samples[len(samples) * 99 // 100], cpu_time
+
+
+def bench():
+    for busy_poll in (0.0, 0.0005, 0.002):
+        p50, p99, cpu_time = measure(busy_poll)
+        print(f'busy_poll={busy_poll * 1e6:>5.0f}us: p50 {p50 * 1e6:.0f}us, p99 {p99 * 1e6:.0f}us, '
+              f'server CPU {cpu_time:.2f}s (spins: {sched.spin_hits} hits, {sched.spin_misses} misses)')
+        sched.spin_hits = sched.spin_misses = 0
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    Измерение задержки ответа сервера на планировщике. Клиент работает в отдельном процессе и с обычными блокирующими
+    сокетами: отправляет запрос, ждет ответ, замеряет время между ними, а затем немного "думает" (gap), прежде чем
+    отправить следующий. Результат - медиана (p50) и 99-й процентиль (p99) задержки и процессорное время сервера.
+
+    Так сравниваются режимы sched.busy_poll. Когда цикл планировщика заснул в select(), ответ на пришедший запрос
+    задерживается на время пробуждения процесса (переключение контекста, разгон ядра процессора из режима
+    энергосбережения). Если sched.busy_poll больше нуля, то перед тем как заснуть, цикл некоторое время крутится,
+    вызывая select() с нулевым таймаутом, и замечает запрос сразу. Окно такого ожидания подстраивается само (_poll):
+    если событие пришло во время кручения, окно удваивается, а если кручение закончилось впустую - уменьшается вдвое,
+    и когда становится меньше 1/16 от busy_poll, кручение отключается. Если после обычного засыпания событие пришло
+    быстрее, чем за busy_poll, то кручение снова включается. Так процессор тратится на кручение только когда события
+    действительно идут часто, и никогда дольше busy_poll за раз.
+
+    На машине с одним ядром кручение отнимает процессор у клиента и выигрыша не дает - режим имеет смысл, когда у
+    процесса сервера есть свое ядро.
+"""
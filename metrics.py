@@ -0,0 +1,87 @@
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+
+from io_scheduler import sched, tcp_server
+
+# Name -> (type, help). Counters only grow, gauges show the current state.
+METRICS = {
+    'ready': ('gauge', 'Functions in the ready queue'),
+    'sleeping': ('gauge', 'Pending timers'),
+    'read_waiting': ('gauge', 'Descriptors waiting to be readable'),
+    'write_waiting': ('gauge', 'Descriptors waiting to be writable'),
+    'tasks_alive': ('gauge', 'Tasks created and not finished yet'),
+    'select_wait_avg': ('gauge', 'Average seconds spent in one select() call'),
+    'iterations': ('counter', 'Iterations of the scheduler loop'),
+    'tasks_created': ('counter', 'Tasks created'),
+    'tasks_finished': ('counter', 'Tasks finished'),
+    'select_calls': ('counter', 'Wakeups from select()'),
+    'spin_hits': ('counter', 'Busy-poll spins that found an event'),
+    'spin_misses': ('counter', 'Busy-poll spins that ended in a blocking select()'),
+}
+
+
+def prometheus_text(stats, prefix='scheduler_'):
+    lines = []
+    for name, value in stats.items():
+        kind, text = METRICS[name]
+        name = prefix + name + ('_total' if kind == 'counter' else '')
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+async def admin_handler(client):
+    # Any request gets the metrics, so both Prometheus and a plain `nc host port` work
+    try:
+        await sched.recv(client, 4096)
+        body = prometheus_text(sched.stats()).encode()
+        header = (b'HTTP/1.0 200 OK\r\n'
+                  b'Content-Type: text/plain; version=0.0.4\r\n'
+                  b'Content-Length: %d\r\n\r\n' % len(body))
+        reply = memoryview(header + body)
+        while reply:
+            reply = reply[await sched.send(client, reply):]
+    except OSError:
+        pass        # The scraper went away, that must not stop the loop the metrics describe
+    finally:
+        client.close()
+
+
+async def admin_server(addr):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(16)
+    sock.setblocking(False)
+    while True:
+        for client, _ in await sched.accept_many(sock, 16):
+            sched.new_task(admin_handler(client))
+
+
+if __name__ == '__main__':
+    sched.new_task(tcp_server(('', 30000)))
+    sched.new_task(admin_server(('127.0.0.1', 30080)))
+    print('Metrics at http://127.0.0.1:30080/metrics')
+    sched.run()
+
+
+"""
+    Метрики планировщика, чтобы во время работы было видно, что происходит внутри цикла.
+
+    Счетчики хранятся прямо в атрибутах планировщика и увеличиваются обычным сложением целых чисел: число итераций
+    цикла, созданных и завершенных задач, вызовов select() и суммарное время, проведенное в select(). Это стоит
+    меньше, чем сам вызов select(), поэтому счетчики включены всегда. Остальные показатели (длина очереди готовых,
+    число таймеров и ожидающих дескрипторов) - это просто длины структур планировщика, они считаются только когда
+    их запрашивают.
+
+    sched.stats() - возвращает снимок всех показателей в виде словаря.
+
+    prometheus_text - переводит снимок в текстовый формат Prometheus: для каждой метрики строки HELP и TYPE и значение.
+    Счетчики получают суффикс _total, как принято в Prometheus.
+
+    admin_server - отдельный серверный сокет для администрирования, который обслуживается тем же циклом планировщика,
+    что и основной сервер, без отдельного потока. На любой запрос отвечает метриками в виде минимального ответа HTTP,
+    поэтому адрес можно указать в настройках Prometheus или посмотреть метрики через curl. Ошибка сокета (клиент
+    сбросил соединение) закрывает только это соединение и не выходит из sched.run(). Лучше слушать только
+    127.0.0.1, чтобы метрики не были видны снаружи.
+"""
@@ -0,0 +1,221 @@
+from io_scheduler import sched, AsyncQueue, QueueClosed, Semaphore, Event
+
+
+def _as_queue(source, maxsize=16):
+    if isinstance(source, AsyncQueue):
+        return source
+    queue = AsyncQueue(maxsize)
+    sched.new_task(_pump(source, queue))
+    return queue
+
+
+async def _pump(source, queue):
+    try:
+        if hasattr(source, '__aiter__'):
+            async for item in source:
+                await queue.put(item)
+        else:
+            for item in source:
+                await queue.put(item)
+    except QueueClosed:
+        return      # Downstream stopped listening
+    except Exception as exc:
+        queue.close(exc)
+        return
+    queue.close()
+
+
+class _Slot:
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.exc = None
+
+
+def map(func, source, concurrency=1, ordered=True, maxsize=16):
+    out = AsyncQueue(maxsize)
+    sched.new_task(_map(func, _as_queue(source, maxsize), concurrency, ordered, out))
+    return out
+
+
+async def _map(func, source, concurrency, ordered, out):
+    running = Semaphore(concurrency)
+    order = AsyncQueue(concurrency) if ordered else None   # Slots in input order
+
+    async def work(item, slot):
+        try:
+            result = await func(item)
+        except Exception as exc:
+            if slot:
+                slot.exc = exc
+            else:
+                out.close(exc)
+        else:
+            if slot:
+                slot.value = result
+            else:
+                try:
+                    await out.put(result)
+                except QueueClosed:
+                    pass
+        if slot:
+            slot.done.set()
+        running.release()
+
+    if ordered:
+        sched.new_task(_emit_in_order(order, out))
+    try:
+        async for item in source:
+            if out.is_closed():
+                break
+            await running.acquire()
+            slot = None
+            if ordered:
+                slot = _Slot()
+                await order.put(slot)
+            sched.new_task(work(item, slot))
+    except Exception as exc:
+        out.close(exc)
+        return
+
+    for _ in range(concurrency):     # Wait for the last calls to finish
+        await running.acquire()
+    if ordered:
+        order.close()
+    else:
+        out.close()
+
+
+async def _emit_in_order(order, out):
+    try:
+        async for slot in order:
+            await slot.done.wait()
+            if slot.exc:
+                out.close(slot.exc)
+                return
+            await out.put(slot.value)
+    except QueueClosed:
+        return
+    out.close()
+
+
+def filter(predicate, source, maxsize=16):
+    out = AsyncQueue(maxsize)
+    sched.new_task(_filter(predicate, _as_queue(source, maxsize), out))
+    return out
+
+
+async def _filter(predicate, source, out):
+    try:
+        async for item in source:
+            if predicate(item):
+                await out.put(item)
+    except QueueClosed:
+        return
+    except Exception as exc:
+        out.close(exc)
+        return
+    out.close()
+
+
+def batch(source, n, timeout=None, maxsize=16):
+    out = AsyncQueue(maxsize)
+    sched.new_task(_batch(_as_queue(source, maxsize), n, timeout, out))
+    return out
+
+
+async def _batch(source, n, timeout, out):
+    items = []
+    deadline = None
+    try:
+        while True:
+            try:
+                if deadline is None:
+                    item = await source.get()
+                else:
+                    item = await source.get(max(deadline - sched.clock(), 0))
+            except TimeoutError:
+                await out.put(items)      # Flush a partial batch
+                items, deadline = [], None
+                continue
+            except QueueClosed:
+                break
+
+            if not items and timeout is not None:
+                deadline = sched.clock() + timeout    # Timeout counts from the first item of a batch
+            items.append(item)
+            if len(items) == n:
+                await out.put(items)
+                items, deadline = [], None
+        if items:
+            await out.put(items)
+    except QueueClosed:
+        return
+    except Exception as exc:
+        out.close(exc)
+        return
+    out.close()
+
+
+def merge(*sources, maxsize=16):
+    out = AsyncQueue(maxsize)
+    remaining = [len(sources)]
+
+    async def forward(source):
+        try:
+            async for item in source:
+                await out.put(item)
+        except QueueClosed:
+            return
+        except Exception as exc:
+            out.close(exc)
+            return
+        remaining[0] -= 1
+        if not remaining[0]:
+            out.close()
+
+    for source in sources:
+        sched.new_task(forward(_as_queue(source, maxsize)))
+    return out
+
+
+async def slow_square(n):
+    await sched.sleep(0.1)
+    return n * n
+
+
+async def main():
+    squares = map(slow_square, range(20), concurrency=5)
+    even = filter(lambda n: n % 2 == 0, squares)
+    async for group in batch(merge(even, range(100, 103)), 3, timeout=0.3):
+        print('Batch', group)
+
+
+if __name__ == '__main__':
+    sched.new_task(main())
+    sched.run()
+
+
+"""
+    Набор стадий для потоковой обработки данных. Каждая стадия принимает источник - AsyncQueue, асинхронный или
+    обычный итерируемый объект - и возвращает новую AsyncQueue с результатами, которую можно передать следующей стадии
+    или перебрать циклом async for. Стадии работают одновременно, как отдельные задачи планировщика, а очереди между
+    ними ограничены по размеру (maxsize). Поэтому данные проходят через конвейер по мере появления, промежуточные
+    списки не накапливаются, а быстрая стадия засыпает на put(), пока медленная не заберет данные.
+
+    Закрытие очереди означает конец данных: стадия, дочитав свой источник, закрывает свою выходную очередь. Если в
+    стадии произошла ошибка, выходная очередь закрывается с этой ошибкой и она выбрасывается у потребителя.
+
+    map(func, source, concurrency, ordered) - применяет корутину func к каждому элементу, запуская одновременно не
+    больше concurrency вызовов (ограничение семафором). Если ordered=True, результаты выходят в порядке элементов:
+    для каждого элемента в очередь order кладется ячейка _Slot, а задача _emit_in_order достает ячейки по порядку и
+    ждет, пока результат в ячейке будет готов. Если ordered=False, результаты выходят в порядке готовности.
+    Дождаться окончания всех вызовов можно, заняв все места семафора.
+
+    filter(predicate, source) - пропускает дальше только элементы, для которых predicate вернул True.
+
+    batch(source, n, timeout) - собирает элементы в списки по n штук. Если с прихода первого элемента пачки прошло
+    timeout секунд, а пачка еще не полная, то она отправляется дальше такой, какая есть.
+
+    merge(*sources) - объединяет несколько источников в одну очередь. Она закрывается, когда закончились все источники.
+"""
@@ -0,0 +1,115 @@
+import sys
+import threading
+from collections import Counter
+
+from io_scheduler import sched, Task
+
+
+class Profiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()      # Collapsed stack -> number of samples
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        main_id = threading.main_thread().ident
+        while not self._stop.wait(self.interval):
+            self.sample(sys._current_frames().get(main_id))
+
+    def sample(self, frame):
+        if frame is not None:
+            self.stacks[';'.join(self._frame_stack(frame))] += 1
+        for task in self._suspended():
+            self.stacks[';'.join(['suspended'] + self._coro_stack(task.coro))] += 1
+
+    @staticmethod
+    def _frame_stack(frame):
+        # Frames of the main thread, outermost first. Everything below Task.__call__ is the
+        # scheduler itself, so a running task gets its own root instead of Scheduler.run.
+        names = []
+        while frame is not None:
+            if frame.f_code is Task.__call__.__code__:
+                return ['running'] + names[::-1]
+            names.append(frame.f_code.co_qualname)
+            frame = frame.f_back
+        return ['loop'] + names[::-1]
+
+    @staticmethod
+    def _coro_stack(coro):
+        # Follow the chain of awaits down to the point where the task is suspended
+        names = []
+        while coro is not None:
+            code = getattr(coro, 'cr_code', None) or getattr(coro, 'gi_code', None)
+            if code is None:
+                break
+            names.append(code.co_qualname)
+            coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+        return names
+
+    @staticmethod
+    def _suspended():
+        # Tasks parked in sleep(), recv(), send() and other waits on the scheduler
+        try:
+            waiting = ([func for _, _, func in list(sched.sleeping)] +
+                       list(sched._read_waiting.values()) + list(sched._write_waiting.values()))
+        except RuntimeError:
+            return []       # Changed by the loop while copying, skip this sample
+        return [func for func in waiting if type(func) is Task]
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.collapsed() + '\n')
+
+
+def _checksum(n):
+    total = 0
+    for i in range(n):
+        total = (total * 31 + i) % 1000003
+    return total
+
+
+async def worker(n):
+    for _ in range(10):
+        _checksum(20000 * n)
+        await sched.sleep(0.05)
+
+
+if __name__ == '__main__':
+    for n in range(1, 4):
+        sched.new_task(worker(n))
+    profiler = Profiler()
+    profiler.start()
+    sched.run()
+    profiler.stop()
+    print(profiler.collapsed())
+
+
+"""
+    Profiler - выборочный профилировщик, который показывает время не по функциям планировщика, а по корутинам.
+    cProfile для сервера на этом планировщике бесполезен: все время приписывается Scheduler.run и Task.__call__.
+
+    Профилировщик работает в отдельном потоке и каждые interval секунд делает снимок (sample):
+    Стек главного потока берется из sys._current_frames(). Если в стеке есть Task.__call__, значит сейчас выполняется
+    шаг задачи, и все, что выше этого кадра - стек корутины задачи. Такой стек записывается с корнем running. Иначе цикл
+    занят собой (например ждет в select()), и стек записывается с корнем loop.
+    Кроме того, для каждой спящей задачи (в очереди спящих или ожидающих чтения и записи) строится стек по цепочке
+    cr_await: корутина задачи ждет другую корутину, та - следующую, и так до метода планировщика, где задача
+    остановилась, например Scheduler.recv или Scheduler.sleep. Такие стеки записываются с корнем suspended. Каждая
+    спящая задача дает по одному отсчету на снимок, поэтому их отсчеты - это суммарное время ожидания всех задач.
+
+    collapsed - результат в формате "кадр;кадр;кадр число_отсчетов" по строке на стек. Этот формат понимают
+    flamegraph.pl и speedscope, которые рисуют по нему flame graph.
+"""
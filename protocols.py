@@ -0,0 +1,238 @@
+import time
+from socket import *
+
+from io_scheduler import sched, echo_handler
+
+
+class Protocol:
+    def connection_made(self, transport):
+        pass
+
+    def data_received(self, data):
+        pass
+
+    def eof_received(self):
+        pass
+
+    def connection_lost(self, exc):
+        pass
+
+
+class Transport:
+    def __init__(self, sock, protocol, scheduler=None):
+        sock.setblocking(False)
+        self.sched = scheduler or sched     # A loop with its own Scheduler (asyncio_loop.py) passes it here
+        self.sock = sock
+        self.protocol = protocol
+        self.buffer = bytearray()     # Data the socket didn't accept yet
+        self.closing = False
+        self.closed = False
+        self.reading = True           # False while paused or after EOF
+        protocol.connection_made(self)
+        if not self.closed and self.reading:
+            self.sched.read_wait(sock, self._read_ready)
+
+    def _read_ready(self):
+        if self.closed:
+            return
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            data = None
+        except OSError as exc:
+            self._force_close(exc)
+            return
+
+        if data:
+            self.protocol.data_received(data)
+        elif data is not None:
+            self.reading = False
+            if not self.protocol.eof_received():     # True keeps the connection half-open for writing
+                self.close()
+        if not self.closed and not self.closing and self.reading:
+            self.sched.read_wait(self.sock, self._read_ready)    # Waiting is one-shot, so register again
+
+    def pause_reading(self):
+        # Flow control: the protocol can't keep up, stop reading until resume_reading()
+        if self.reading and not self.closed:
+            self.reading = False
+            self.sched._read_waiting.pop(self.sock, None)
+
+    def resume_reading(self):
+        if not self.reading and not self.closed and not self.closing:
+            self.reading = True
+            self.sched.read_wait(self.sock, self._read_ready)
+
+    def write(self, data):
+        if self.closed or self.closing:
+            return
+        if not self.buffer:
+            try:
+                sent = self.sock.send(data)      # Fast path: nothing queued, write right away
+            except BlockingIOError:
+                sent = 0
+            except OSError as exc:
+                self._force_close(exc)
+                return
+            data = data[sent:]
+            if not data:
+                return
+            self.sched.write_wait(self.sock, self._write_ready)
+        self.buffer += data
+
+    def _write_ready(self):
+        if self.closed:
+            return
+        try:
+            sent = self.sock.send(self.buffer)
+        except BlockingIOError:
+            sent = 0
+        except OSError as exc:
+            self._force_close(exc)
+            return
+        del self.buffer[:sent]
+        if self.buffer:
+            self.sched.write_wait(self.sock, self._write_ready)
+        elif self.closing:
+            self._force_close(None)
+
+    def close(self):
+        if self.closing or self.closed:
+            return
+        self.closing = True
+        self.sched._read_waiting.pop(self.sock, None)
+        if not self.buffer:
+            self._force_close(None)    # Otherwise closed once the buffer is flushed
+
+    def _force_close(self, exc):
+        if self.closed:
+            return
+        self.closed = True
+        self.sched._read_waiting.pop(self.sock, None)
+        self.sched._write_waiting.pop(self.sock, None)
+        self.sock.close()
+        self.protocol.connection_lost(exc)
+
+
+class Server:
+    def __init__(self, sock, protocol_factory, max_accept=64, scheduler=None, transport=Transport):
+        sock.setblocking(False)
+        self.sched = scheduler or sched
+        self.sock = sock
+        self.protocol_factory = protocol_factory
+        self.max_accept = max_accept
+        self.transport = transport      # Transport class created for every connection
+        self.sched.read_wait(sock, self._accept_ready)
+
+    def _accept_ready(self):
+        for _ in range(self.max_accept):
+            try:
+                client, _ = self.sock.accept()
+            except BlockingIOError:
+                break
+            except OSError:
+                continue        # The client went away before accept(), or out of descriptors for now
+            self.transport(client, self.protocol_factory(), self.sched)
+        self.sched.read_wait(self.sock, self._accept_ready)
+
+    def close(self):
+        self.sched._read_waiting.pop(self.sock, None)
+        self.sock.close()
+
+
+def create_server(addr, protocol_factory, backlog=128, max_accept=64):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(backlog)
+    return Server(sock, protocol_factory, max_accept)
+
+
+class EchoProtocol(Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.transport.write(b'Got:' + data)
+
+    def connection_lost(self, exc):
+        print('Connection closed')
+
+
+async def _coroutine_server(sock, clients):
+    for _ in range(clients):
+        client, _ = await sched.accept(sock)
+        sched.new_task(echo_handler(client))
+    sock.close()
+
+
+async def _bench_client(addr, count, size, stats):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setblocking(False)
+    await sched.connect(sock, addr)
+    message = b'x' * size
+    reply = len(message) + len(b'Got:')
+    for _ in range(count):
+        await sched.send(sock, message)
+        received = 0
+        while received < reply:
+            received += len(await sched.recv(sock, 65536))
+    stats['messages'] += count
+    stats['clients'] -= 1
+    if not stats['clients'] and stats['server']:
+        stats['server'].close()    # The protocol server would keep the loop running forever
+    sock.close()
+
+
+def bench(clients=10, count=5000, size=100):
+    for name, port in [('coroutines', 30006), ('protocol', 30007)]:
+        addr = ('127.0.0.1', port)
+        stats = {'messages': 0, 'clients': clients, 'server': None}
+        if name == 'protocol':
+            stats['server'] = create_server(addr, EchoProtocol)
+        else:
+            sock = socket(AF_INET, SOCK_STREAM)
+            sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            sock.bind(addr)
+            sock.listen(clients)
+            sched.new_task(_coroutine_server(sock, clients))
+        for _ in range(clients):
+            sched.new_task(_bench_client(addr, count, size, stats))
+
+        start = time.perf_counter()
+        sched.run()
+        elapsed = time.perf_counter() - start
+        print(f'{name:>10}: {stats["messages"] / elapsed:.0f} echo round-trips/sec')
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    Протоколы и транспорты - способ обрабатывать соединения колбэками, как в файле callbacks/scheduler.py, без корутин.
+    Обработка данных в echo_handler стоит приостановки и возобновления корутины и вызова Task.__call__ на каждое
+    чтение и запись. Здесь же планировщик напрямую вызывает метод транспорта, когда сокет готов, а тот вызывает
+    методы протокола.
+
+    Protocol - описывает, что делать с соединением. Его методы вызываются транспортом:
+    connection_made(transport) - соединение установлено, transport нужен, чтобы отправлять данные
+    data_received(data) - пришли данные
+    eof_received() - клиент закрыл соединение со своей стороны
+    connection_lost(exc) - соединение закрыто, exc - ошибка, из-за которой оно закрылось, либо None
+
+    Transport - владеет сокетом. Кладет свой метод _read_ready в очередь ожидающих чтения планировщика, и после каждого
+    вызова кладет его туда снова, так как ожидание в планировщике одноразовое. По умолчанию используется общий
+    планировщик sched, но можно передать свой (так делает цикл asyncio из файла asyncio_loop.py).
+    pause_reading() и resume_reading() - управление потоком: пока протокол не успевает обрабатывать данные, сокет не
+    ожидает чтения. Если eof_received() вернул True, то соединение после конца данных от клиента не закрывается, и
+    в него еще можно писать (как в asyncio).
+    write() сразу пытается отправить данные. Что не поместилось в сокет, дописывается в буфер и отправляется методом
+    _write_ready, когда сокет станет готов к записи. close() закрывает сокет сразу, если буфер пуст, иначе после того,
+    как буфер будет отправлен.
+
+    Server - принимает подключения так же, как accept_many() в io_scheduler.py, только колбэком, и на каждое
+    подключение создает транспорт (класс transport) и новый протокол.
+
+    bench - Сравнивает эхо-сервер на корутинах (echo_handler) и на протоколе (EchoProtocol) при одинаковой нагрузке.
+"""
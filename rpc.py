@@ -0,0 +1,325 @@
+import os
+import signal
+import struct
+import time
+from socket import *
+
+from io_scheduler import sched, Event
+
+HEADER = struct.Struct('!IIB')      # Payload size, request id, kind
+REQUEST, RESPONSE, ERROR = 0, 1, 2
+
+
+class RpcError(Exception):
+    pass
+
+
+class _Connection:
+    max_frame = 1 << 24     # Larger declared payloads drop the connection instead of growing the buffer
+
+    def __init__(self, sock):
+        sock.setblocking(False)
+        self.sock = sock
+        self.outgoing = bytearray()     # Frames not sent yet, flushed by the writer task in one send()
+        self.flush = Event()
+        self.closing = False
+        self.reader_done = self.writer_done = False
+        sched.new_task(self._reader())
+        sched.new_task(self._writer())
+
+    def write(self, request_id, kind, payload):
+        if self.writer_done:
+            return      # The connection is gone, nobody will send this
+        self.outgoing += HEADER.pack(len(payload), request_id, kind)
+        self.outgoing += payload
+        self.flush.set()
+
+    def close(self):
+        self.closing = True
+        self.flush.set()
+
+    async def _writer(self):
+        while self.outgoing or not self.closing:
+            if not self.outgoing:
+                self.flush.clear()
+                await self.flush.wait()
+                continue
+            # Everything written while the previous send() was waiting goes out together
+            view = memoryview(self.outgoing)
+            self.outgoing = bytearray()
+            try:
+                while view:
+                    view = view[await sched.send(self.sock, view):]
+            except OSError:
+                break
+        self.writer_done = True
+        self.outgoing = bytearray()
+        if self.reader_done:
+            self.sock.close()
+            return
+        try:
+            self.sock.shutdown(SHUT_WR)     # Peer sees EOF, the reader still gets its last frames
+        except OSError:
+            pass                            # Peer reset the connection, the reader sees it too
+
+    async def _reader(self):
+        buffer = bytearray()
+        while True:
+            try:
+                data = await sched.recv(self.sock, 65536)
+            except OSError:
+                data = b''
+            if not data:
+                break
+            buffer += data
+            pos = 0
+            while len(buffer) - pos >= HEADER.size:
+                size, request_id, kind = HEADER.unpack_from(buffer, pos)
+                if size > self.max_frame:
+                    self.reader_done = True     # Broken or hostile peer, stop reading and drop the connection
+                    break
+                end = pos + HEADER.size + size
+                if len(buffer) < end:
+                    break
+                self.received(request_id, kind, bytes(buffer[pos + HEADER.size:end]))
+                pos = end
+            if self.reader_done:
+                break
+            del buffer[:pos]
+        self.reader_done = True
+        self.eof()
+        if self.writer_done:
+            self.sock.close()
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.exc = None
+
+
+class RpcClient(_Connection):
+    def __init__(self, sock):
+        self.next_id = 0
+        self.calls = {}         # Request id -> _Call of the waiting caller
+        super().__init__(sock)
+
+    async def call(self, method, data=b''):
+        if self.closing:
+            raise ConnectionError('RPC connection is closed')
+        self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+        request_id = self.next_id
+        call = self.calls[request_id] = _Call()
+        method = method.encode()
+        self.write(request_id, REQUEST, bytes([len(method)]) + method + data)
+        await call.done.wait()
+        if call.exc:
+            raise call.exc
+        return call.value
+
+    def received(self, request_id, kind, payload):
+        call = self.calls.pop(request_id, None)
+        if call is None:
+            return
+        if kind == ERROR:
+            call.exc = RpcError(payload.decode(errors='replace'))
+        else:
+            call.value = payload
+        call.done.set()
+
+    def eof(self):
+        for call in self.calls.values():
+            call.exc = ConnectionError('RPC connection lost')
+            call.done.set()
+        self.calls.clear()
+        self.close()
+
+
+class _ServerConnection(_Connection):
+    def __init__(self, sock, handlers):
+        self.handlers = handlers
+        self.pending = 0
+        self.eof_seen = False
+        super().__init__(sock)
+
+    def received(self, request_id, kind, payload):
+        # A bad frame is answered with ERROR, it must not raise inside the reader task
+        if kind != REQUEST or not payload or len(payload) < 1 + payload[0]:
+            self.write(request_id, ERROR, b'Malformed request frame')
+            return
+        size = payload[0]
+        try:
+            method = payload[1:1 + size].decode()
+        except UnicodeDecodeError:
+            self.write(request_id, ERROR, b'Method name is not UTF-8')
+            return
+        self.pending += 1
+        sched.new_task(self._handle(request_id, method, payload[1 + size:]))
+
+    async def _handle(self, request_id, method, data):
+        try:
+            handler = self.handlers.get(method)
+            if handler is None:
+                raise RpcError(f'Unknown method {method!r}')
+            result = await handler(data)
+            if not isinstance(result, (bytes, bytearray)):
+                raise RpcError(f'Method {method!r} returned {type(result).__name__}, not bytes')
+        except Exception as exc:
+            self.write(request_id, ERROR, str(exc).encode())
+        else:
+            self.write(request_id, RESPONSE, result)
+        self.pending -= 1
+        if self.eof_seen and not self.pending:
+            self.close()
+
+    def eof(self):
+        self.eof_seen = True        # Client is done sending, answer the requests already received
+        if not self.pending:
+            self.close()
+
+
+async def rpc_server(addr, handlers, backlog=128, max_accept=64):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    while True:
+        for client, _ in await sched.accept_many(sock, max_accept):
+            try:
+                client.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+            except OSError:
+                client.close()      # Reset before we got to it
+                continue
+            _ServerConnection(client, handlers)
+
+
+async def rpc_connect(addr):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setblocking(False)
+    await sched.connect(sock, addr)
+    sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+    return RpcClient(sock)
+
+
+async def upper(data):
+    return data.upper()
+
+
+async def slow(data):
+    await sched.sleep(0.1)
+    return data
+
+
+HANDLERS = {'upper': upper, 'slow': slow}
+
+
+async def _caller(client, count, stats):
+    for n in range(count):
+        await client.call('upper', b'hello %d' % n)
+        stats['calls'] += 1
+
+
+async def _bench_client(addr, concurrency, count, stats):
+    client = await rpc_connect(addr)
+    finished = Event()
+    remaining = [concurrency]
+
+    async def run():
+        await _caller(client, count, stats)
+        remaining[0] -= 1
+        if not remaining[0]:
+            finished.set()
+
+    for _ in range(concurrency):
+        sched.new_task(run())
+    await finished.wait()
+    client.close()
+
+
+async def main(addr):
+    client = await rpc_connect(addr)
+    print(await client.call('upper', b'hello'))
+    try:
+        await client.call('missing')
+    except RpcError as exc:
+        print('Error:', exc)
+
+    # Several callers share one connection, replies come back in the order they are ready
+    async def call(n, method):
+        print(n, method, await client.call(method, b'call %d' % n))
+
+    for n in range(6):
+        sched.new_task(call(n, 'slow' if n % 2 else 'upper'))
+    await sched.sleep(0.5)
+    client.close()
+
+
+def _serve(addr):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            sched.new_task(rpc_server(addr, HANDLERS))
+            sched.run()
+        finally:
+            os._exit(0)
+    time.sleep(0.3)     # Let the server start listening
+    return pid
+
+
+def bench(addr, total=20000):
+    for concurrency in (1, 10, 100):
+        stats = {'calls': 0}
+        sched.new_task(_bench_client(addr, concurrency, total // concurrency, stats))
+        start = time.perf_counter()
+        sched.run()
+        elapsed = time.perf_counter() - start
+        print(f'{concurrency:>3} callers on one connection: {stats["calls"] / elapsed:,.0f} calls/sec')
+
+
+if __name__ == '__main__':
+    address = ('127.0.0.1', 30004)
+    server_pid = _serve(address)
+    try:
+        sched.new_task(main(address))
+        sched.run()
+        bench(address)
+    finally:
+        os.kill(server_pid, signal.SIGTERM)
+        os.waitpid(server_pid, 0)
+
+
+"""
+    Фреймовый RPC поверх сокетов планировщика. Раньше сервисы обменивались запросами так, что на соединении был только
+    один запрос в полете: следующий запрос отправлялся только после ответа на предыдущий.
+
+    Каждое сообщение - кадр: заголовок HEADER (длина данных, номер запроса, тип кадра: REQUEST, RESPONSE или ERROR) и
+    данные. Данные запроса - длина имени метода (1 байт), имя метода и аргумент в виде байтов. По номеру запроса ответ
+    сопоставляется с запросом, поэтому ответы могут приходить в любом порядке.
+
+    _Connection - общая часть клиента и сервера. Задача _reader читает из сокета в буфер и разбирает из него все
+    полные кадры, передавая каждый в received(). Кадры не отправляются сразу: write() дописывает кадр в буфер outgoing
+    и будит задачу _writer. Пока _writer ждал сокет или пока выполнялись другие задачи, в буфер успевают попасть кадры
+    от многих задач, и они уходят одним вызовом send(). Закрытие: _writer дописывает оставшееся и делает
+    shutdown(SHUT_WR), чтобы другая сторона получила конец данных, а сокет закрывается, когда закончили и чтение, и
+    запись.
+    Ошибка одного соединения не должна останавливать весь планировщик: исключение в задаче _reader или _writer
+    вышло бы из sched.run(). Поэтому ошибки сокета (обрыв соединения, в том числе при shutdown()) просто завершают
+    работу с этим соединением. Кадр с заявленной длиной больше max_frame (16 МБ) тоже закрывает соединение: иначе
+    такой заголовок заставил бы буфер расти без ограничения.
+
+    RpcClient - много задач могут одновременно вызывать call() на одном соединении. Каждый вызов получает новый номер
+    запроса и кладет в словарь calls (номер -> ожидающий вызов) объект _Call с Event, после чего засыпает на нем.
+    Пришедший ответ находит свой вызов в словаре по номеру, записывает в него результат или ошибку (RpcError) и будит
+    его. Если соединение оборвалось, все ожидающие вызовы получают ConnectionError.
+
+    rpc_server - для каждого соединения создается _ServerConnection, который на каждый пришедший запрос запускает
+    отдельную задачу с обработчиком из словаря handlers. Поэтому медленный запрос (slow) не задерживает быстрые, а их
+    ответы собираются в общий буфер и отправляются пачками. Когда клиент закрыл свою сторону, сервер дожидается
+    ответов на все уже полученные запросы и закрывает соединение. На запрос с пустыми данными, с длиной имени метода
+    больше самих данных или с именем не в UTF-8 сервер отвечает кадром ERROR, как и на обработчик, который вернул не
+    байты.
+
+    bench - число вызовов в секунду через одно соединение при 1, 10 и 100 одновременно вызывающих задачах.
+"""
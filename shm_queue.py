@@ -0,0 +1,219 @@
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+from io_scheduler import sched, switch, QueueClosed
+from unix_sockets import Channel
+
+U64 = struct.Struct('<Q')
+U32 = struct.Struct('<I')
+HEAD = 0                # Write position, changed only by the producer
+TAIL = 64               # Read position, changed only by the consumer (own cache line)
+CLOSED = 128
+CONSUMER_WAITING = 136
+PRODUCER_WAITING = 144
+DATA = 192
+WRAP = 0xFFFFFFFF       # Record length meaning "continue from the start of the ring"
+
+
+class ShmQueue:
+    def __init__(self, capacity=1 << 20):
+        self.shm = shared_memory.SharedMemory(create=True, size=DATA + capacity)
+        self.buf = self.shm.buf
+        self.buf[:DATA] = bytes(DATA)
+        self.capacity = capacity
+        # Counters that only this side changes, kept locally to avoid reading them from the header
+        self.head = 0
+        self.tail = 0
+        # One eventfd per side, created before fork() so both processes share them
+        self.consumer_event = os.eventfd(0, os.EFD_NONBLOCK)
+        self.producer_event = os.eventfd(0, os.EFD_NONBLOCK)
+
+    def _get(self, offset):
+        return U64.unpack_from(self.buf, offset)[0]
+
+    def _set(self, offset, value):
+        U64.pack_into(self.buf, offset, value)
+
+    def is_closed(self):
+        return bool(self._get(CLOSED))
+
+    def close(self):
+        self._set(CLOSED, 1)
+        self._wake(CONSUMER_WAITING, self.consumer_event)
+        self._wake(PRODUCER_WAITING, self.producer_event)
+
+    def _wake(self, flag, event):
+        # The only syscall on the fast path, and only if the other side said it is going to sleep
+        if self._get(flag):
+            self._set(flag, 0)
+            os.eventfd_write(event, 1)
+
+    async def _wait(self, flag, event, ready):
+        self._set(flag, 1)
+        if not ready():             # Check again, the other side may have acted before seeing the flag
+            sched.read_wait(event, sched.current)
+            sched.current = None
+            await switch()
+            try:
+                os.eventfd_read(event)
+            except BlockingIOError:
+                pass
+        self._set(flag, 0)
+
+    # Producer side
+    async def put(self, data):
+        size = U32.size + len(data)
+        if size > self.capacity:
+            raise ValueError('Record does not fit into the queue')
+        while True:
+            if self.is_closed():
+                raise QueueClosed()
+            head = self.head
+            offset = head % self.capacity
+            pad = self.capacity - offset if self.capacity - offset < size else 0   # Records never wrap around
+            if head + pad + size - self._get(TAIL) <= self.capacity:
+                break
+            await self._wait(PRODUCER_WAITING, self.producer_event,
+                             lambda: head + pad + size - self._get(TAIL) <= self.capacity or self.is_closed())
+
+        if pad:
+            if pad >= U32.size:
+                U32.pack_into(self.buf, DATA + offset, WRAP)
+            offset = 0
+        U32.pack_into(self.buf, DATA + offset, len(data))
+        self.buf[DATA + offset + U32.size:DATA + offset + size] = data
+        self.head = head + pad + size
+        self._set(HEAD, self.head)          # Publish the record after it is written
+        self._wake(CONSUMER_WAITING, self.consumer_event)
+
+    # Consumer side
+    async def get(self):
+        while self.tail == self._get(HEAD):
+            if self.is_closed():
+                raise QueueClosed()
+            await self._wait(CONSUMER_WAITING, self.consumer_event,
+                             lambda: self.tail != self._get(HEAD) or self.is_closed())
+
+        offset = self.tail % self.capacity
+        if self.capacity - offset < U32.size or U32.unpack_from(self.buf, DATA + offset)[0] == WRAP:
+            self.tail += self.capacity - offset     # Skip padding at the end of the ring
+            offset = 0
+        size, = U32.unpack_from(self.buf, DATA + offset)
+        start = DATA + offset + U32.size
+        data = bytes(self.buf[start:start + size])
+        self.tail += U32.size + size
+        self._set(TAIL, self.tail)
+        self._wake(PRODUCER_WAITING, self.producer_event)
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except QueueClosed:
+            raise StopAsyncIteration
+
+    def release(self):
+        self.buf.release()
+        self.shm.close()
+        os.close(self.consumer_event)
+        os.close(self.producer_event)
+
+    def unlink(self):
+        self.shm.unlink()       # Called once, by the process that created the queue
+
+
+async def producer(q, count, size):
+    record = b'x' * size
+    for _ in range(count):
+        await q.put(record)
+    q.close()
+
+
+async def consumer(q, stats):
+    async for data in q:
+        stats['received'] += len(data)
+
+
+async def channel_producer(channel, count, size):
+    record = b'x' * size
+    for _ in range(count):
+        await channel.send(record)
+    channel.close()
+
+
+async def channel_consumer(channel, stats):
+    try:
+        while True:
+            stats['received'] += len(await channel.recv())
+    except EOFError:
+        channel.close()
+
+
+def bench(count=100000, size=1000):
+    for name in ('shared memory', 'socket channel'):
+        if name == 'shared memory':
+            q = ShmQueue()
+            ends = (q, q)
+        else:
+            ends = Channel.pair()
+        start = time.perf_counter()
+        if os.fork() == 0:
+            if name == 'shared memory':
+                sched.new_task(producer(q, count, size))
+            else:
+                ends[1].close()
+                sched.new_task(channel_producer(ends[0], count, size))
+            sched.run()
+            os._exit(0)
+
+        stats = {'received': 0}
+        if name == 'shared memory':
+            sched.new_task(consumer(q, stats))
+        else:
+            ends[0].close()
+            sched.new_task(channel_consumer(ends[1], stats))
+        sched.run()
+        os.wait()
+        elapsed = time.perf_counter() - start
+        if name == 'shared memory':
+            q.release()
+            q.unlink()
+        print(f'{name:>14}: {count / elapsed:,.0f} records/sec, {stats["received"] / elapsed / 1e6:,.0f} MB/sec')
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    ShmQueue - очередь между двумя процессами через общую память (multiprocessing.shared_memory). Раньше задачи
+    передавались через каналы (pipe, Channel из unix_sockets.py): данные копируются в ядро и обратно, и на каждое
+    сообщение приходится системный вызов. Здесь данные записываются прямо в память, которую видят оба процесса.
+
+    Очередь рассчитана на одного производителя и одного потребителя (SPSC) и обходится без блокировок: позицию записи
+    (HEAD) меняет только производитель, позицию чтения (TAIL) - только потребитель. Позиции только растут, место в
+    буфере - позиция по модулю capacity. Запись имеет переменную длину: 4 байта длины и сами данные. Запись никогда не
+    разрывается на конце буфера: если она не помещается до конца, остаток заполняется отметкой WRAP, и запись
+    начинается с начала буфера. Производитель сначала записывает данные и только потом сдвигает HEAD, поэтому
+    потребитель не увидит недописанную запись.
+
+    put и get работают так же, как у AsyncQueue из async_await/async_queue_with_error.py: put() засыпает, если места
+    нет, get() засыпает, если очередь пуста. После close() put() выбрасывает QueueClosed, а get() отдает оставшиеся
+    записи и затем выбрасывает QueueClosed, поэтому очередь можно перебирать циклом async for.
+
+    Чтобы разбудить планировщик другого процесса, у каждой стороны есть свой eventfd: планировщик ждет его в select(),
+    как сокет. Но системный вызов делается только когда другая сторона действительно спит: перед сном сторона ставит
+    в общей памяти флаг ожидания (CONSUMER_WAITING или PRODUCER_WAITING), еще раз проверяет, не появились ли данные или
+    место, и только потом засыпает. Другая сторона после каждой операции смотрит на флаг и пишет в eventfd только если
+    он установлен. Пока обе стороны заняты, данные идут через память вообще без системных вызовов.
+
+    eventfd создаются в конструкторе, поэтому очередь надо создать до os.fork(). Общую память удаляет (unlink) тот
+    процесс, который ее создал.
+
+    bench - передает одни и те же записи из дочернего процесса в родительский через ShmQueue и через Channel.
+"""
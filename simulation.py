@@ -0,0 +1,81 @@
+import time
+
+from io_scheduler import sched, echo_handler
+
+
+class FakeSocket:
+    def __init__(self):
+        self.buffer = bytearray()    # Data sent by the peer, not read yet
+        self.peer = None
+        self.closed = False
+        self.eof = False             # Peer closed its end
+
+    def readable(self):
+        return bool(self.buffer) or self.eof
+
+    def writable(self):
+        return not self.closed
+
+    def recv(self, maxbytes):
+        data = bytes(self.buffer[:maxbytes])
+        del self.buffer[:maxbytes]
+        return data
+
+    def send(self, data):
+        if self.closed or self.peer.closed:
+            raise BrokenPipeError()
+        self.peer.buffer += data
+        return len(data)
+
+    def close(self):
+        self.closed = True
+        self.peer.eof = True
+
+
+def socketpair():
+    a, b = FakeSocket(), FakeSocket()
+    a.peer, b.peer = b, a
+    return a, b
+
+
+async def countdown(n):
+    while n > 0:
+        print('Down', n, 'at', sched.clock())
+        await sched.sleep(3600)     # An hour of simulated time
+        n -= 1
+
+
+async def client(sock, count):
+    for n in range(count):
+        await sched.send(sock, b'ping %d' % n)
+        print('Reply', await sched.recv(sock, 100), 'at', sched.clock())
+        await sched.sleep(600)
+    sock.close()
+
+
+if __name__ == '__main__':
+    sched.virtual_time = 0.0
+    server_sock, client_sock = socketpair()
+    sched.new_task(countdown(24))
+    sched.new_task(echo_handler(server_sock))
+    sched.new_task(client(client_sock, 5))
+
+    start = time.perf_counter()
+    sched.run()
+    print(f'Simulated {sched.clock() / 3600:.0f} hours in {time.perf_counter() - start:.3f} seconds')
+
+
+"""
+    Симуляция для быстрых и повторяемых проверок. Корутины в этом проекте спят по-настоящему (sched.sleep(4)), поэтому
+    проверка кода с долгими таймаутами занимала бы минуты и часы. Если присвоить sched.virtual_time = 0.0, то
+    планировщик работает по виртуальным часам: когда готовых задач нет, он сразу переводит часы на время пробуждения
+    ближайшей спящей задачи, а не ждет его. Сутки работы countdown() здесь проходят за доли секунды.
+
+    FakeSocket - поддельный сокет, который не обращается к операционной системе. Данные, отправленные методом send(),
+    просто дописываются в буфер сокета на другой стороне пары. Планировщик в режиме виртуального времени спрашивает у
+    поддельного сокета, готов ли тот к чтению (readable) или записи (writable), вместо вызова select(). Поэтому
+    обработчики вроде echo_handler, работающие через sched.recv() и sched.send(), можно проверять без сети.
+
+    socketpair - создает пару соединенных поддельных сокетов. close() на одной стороне означает, что на другой
+    стороне recv() вернет пустые данные, как при отключении настоящего клиента.
+"""
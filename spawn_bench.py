@@ -0,0 +1,97 @@
+import os
+import time
+from socket import *
+
+from io_scheduler import sched
+
+CACHE = {n: b'value %d' % n for n in range(100)}
+
+
+async def lookup(key, results):
+    results.append(CACHE[key % 100])      # Cache hit, finishes without waiting
+
+
+async def spawner(count, results):
+    for n in range(count):
+        sched.new_task(lookup(n, results))
+
+
+def spawn(count=200000):
+    results = []
+    start = time.perf_counter()     # In eager mode new_task() already runs the spawner
+    sched.new_task(spawner(count, results))
+    sched.run()
+    return count / (time.perf_counter() - start)
+
+
+async def _handler(client):
+    await sched.recv(client, 100)
+    await sched.send(client, b'OK')
+    client.close()
+
+
+async def _server(sock, connections):
+    # The accept loop of tcp_server: one task per connection
+    while connections:
+        for client, _ in await sched.accept_many(sock, 64):
+            sched.new_task(_handler(client))
+            connections -= 1
+    sock.close()
+
+
+def _clients(addr, connections, batch):
+    for _ in range(connections // batch):
+        socks = [create_connection(addr) for _ in range(batch)]
+        for sock in socks:
+            sock.send(b'hello')
+        for sock in socks:
+            sock.recv(100)
+            sock.close()
+
+
+def connections(addr=('127.0.0.1', 30005), count=5000, batch=50):
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(batch)
+    sock.setblocking(False)
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _clients(addr, count, batch)
+        finally:
+            os._exit(0)
+    sched.new_task(_server(sock, count))
+    sched.run()
+    os.waitpid(pid, 0)
+    return count / (time.perf_counter() - start)
+
+
+def bench():
+    for eager in (False, True):
+        sched.eager = eager
+        mode = 'eager' if eager else 'queued'
+        print(f'{mode:>6}: {spawn():,.0f} short tasks/sec, {connections():,.0f} connections/sec, '
+              f'{sched.iterations:,} loop iterations')
+        sched.iterations = 0
+    sched.eager = False
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    Сравнение обычного и "жадного" (sched.eager = True) запуска задач.
+
+    Обычно new_task() кладет задачу в очередь готовых, и она начнет выполняться только когда до нее дойдет цикл
+    планировщика. Задача, которая завершается не заснув ни разу (например, ответ из кэша), все равно проходит через
+    очередь. В жадном режиме new_task() сразу выполняет задачу до первого ожидания (recv, sleep и т.п.), и в очередь
+    она попадает, только если действительно заснула. Текущая задача при этом сохраняется и восстанавливается, потому
+    что new_task() вызывается из другой задачи. Исключение в жадно запущенной задаче выбрасывается прямо из new_task().
+
+    spawn - задача порождает много коротких задач, которые завершаются сразу.
+    connections - цикл приема подключений как в tcp_server: на каждое подключение создается задача-обработчик, которая
+    в жадном режиме сразу доходит до recv(). Клиенты работают в дочернем процессе пачками по batch подключений.
+"""
@@ -0,0 +1,34 @@
+import time
+
+from io_scheduler import sched, AsyncQueue
+
+
+def test_get_timeout_woken_by_put():
+    queue = AsyncQueue()
+    got = []
+
+    async def consumer():
+        got.append(await queue.get(timeout=10))
+
+    async def producer():
+        await queue.put('item')
+
+    sched.new_task(consumer())
+    sched.new_task(producer())
+    start = time.perf_counter()
+    sched.run()     # The cancelled 10 second timer must not keep the loop alive
+    assert time.perf_counter() - start < 1
+    assert got == ['item']
+    assert not sched.sleeping
+
+
+def test_many_cancelled_timers():
+    timers = [sched.call_later(10, lambda: None) for _ in range(1000)]
+    for timer in timers[1:]:
+        sched.cancel_later(timer)
+    assert len(sched.sleeping) < 100      # Rebuilt once most entries were cancelled
+    sched.cancel_later(timers[0])
+    assert not sched.sleeping
+    start = time.perf_counter()
+    sched.run()
+    assert time.perf_counter() - start < 1
@@ -0,0 +1,179 @@
+import json
+import os
+import time
+from socket import socketpair
+from types import CodeType
+
+from io_scheduler import sched, Task, AsyncQueue
+
+
+class Tracer:
+    def __init__(self, size=100000, sample=16):
+        self.events = [None] * size    # Ring buffer, the oldest events get overwritten
+        self.size = size
+        self.pos = 0
+        self.wrapped = False
+        self.sample = sample            # Every sample-th step is timed on its own, 1 times all of them
+        self.countdown = sample
+        self.now = time.perf_counter
+        self.start = self.now()
+
+    def run_ready(self, ready):
+        # Called by Scheduler.run instead of its own step loop. Hot path: a counter per step, the clock is read
+        # only around the whole batch and around sampled steps.
+        start = self.now()
+        countdown = steps = self.countdown
+        while ready:
+            func = ready.popleft()
+            countdown -= 1
+            if countdown:
+                func()
+            else:
+                countdown = self.sample
+                steps += countdown      # The step count is kept by the countdown itself
+                self.step(func)
+        self.countdown = countdown
+        self.events[self.pos] = ('batch', start, self.now(), steps - countdown)
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+            self.wrapped = True
+
+    def step(self, func):
+        # Names are resolved only in dump(), for a task keep just its code object so finished
+        # coroutines are not kept alive by the buffer.
+        start = self.now()
+        func()
+        self.events[self.pos] = (func.coro.cr_code if type(func) is Task else func, start, self.now())
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+            self.wrapped = True
+
+    def select(self, start, readable, writable):
+        self.events[self.pos] = ('select', start, self.now(), readable, writable)
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+            self.wrapped = True
+
+    def instant(self, name):
+        self.events[self.pos] = (name, self.now(), None)
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+            self.wrapped = True
+
+    def recorded(self):
+        if not self.wrapped:
+            return self.events[:self.pos]
+        return self.events[self.pos:] + self.events[:self.pos]
+
+    @staticmethod
+    def _name(func):
+        if isinstance(func, CodeType):
+            return func.co_qualname
+        return getattr(func, '__qualname__', type(func).__name__)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = []
+        for func, start, end, *args in self.recorded():
+            event = {'pid': pid, 'tid': 0, 'ts': (start - self.start) * 1e6}
+            if func == 'select':
+                event.update(name='select', cat='select', ph='X', dur=(end - start) * 1e6,
+                             args={'readable': args[0], 'writable': args[1]})
+            elif func == 'batch':
+                event.update(name='ready batch', cat='batch', ph='X', dur=(end - start) * 1e6,
+                             args={'steps': args[0]})
+            elif isinstance(func, str):
+                event.update(name=func, cat='instant', ph='i', s='t')
+            else:
+                event.update(name=self._name(func), cat='step', ph='X', dur=(end - start) * 1e6)
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+async def _client(sock, count):
+    for n in range(count):
+        await sched.send(sock, b'ping')
+        await sched.recv(sock, 100)
+    sock.close()
+
+
+async def _server(sock, queue):
+    while True:
+        data = await sched.recv(sock, 100)
+        if not data:
+            break
+        await queue.put(data)     # Hand the request to a worker, as a server with a job queue would
+        await sched.send(sock, await queue.get())
+    sock.close()
+
+
+def workload(pairs=100, count=1000):
+    for _ in range(pairs):
+        a, b = socketpair()
+        sched.new_task(_client(a, count))
+        sched.new_task(_server(b, AsyncQueue()))
+    start = time.perf_counter()
+    sched.run()
+    return time.perf_counter() - start
+
+
+def bench(rounds=15):
+    # Single runs on a busy machine vary by more than the cost being measured: alternate short runs
+    # with and without the tracer and compare the best of each
+    best = {None: float('inf'), 16: float('inf'), 1: float('inf')}
+    for _ in range(rounds):
+        for sample in best:
+            sched.tracer = Tracer(sample=sample) if sample else None
+            best[sample] = min(best[sample], workload(pairs=50, count=300))
+            if sample == 16:
+                sched.tracer.dump('trace.json')
+    sched.tracer = None
+    plain = best.pop(None)
+    print(f'without tracer: {plain:.3f}s')
+    for sample, traced in best.items():
+        print(f'Tracer(sample={sample}): {traced:.3f}s ({(traced / plain - 1) * 100:+.1f}%)')
+    print('Trace written to trace.json, open it in https://ui.perfetto.dev')
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    Tracer - записывает, чем был занят цикл планировщика, чтобы при всплесках задержек было видно, что происходило.
+    Включается присваиванием sched.tracer = Tracer(), выключается присваиванием None.
+
+    События хранятся в кольцевом буфере фиксированного размера: после заполнения новые события затирают самые старые.
+    Поэтому трассировку можно держать включенной долго - память не растет, а в буфере всегда последние size событий.
+    Событие - это кортеж, а не словарь, и время берется функцией time.perf_counter(), чтобы запись стоила как можно
+    меньше. Вместо задачи в буфере хранится только объект кода ее корутины, чтобы буфер не удерживал в памяти
+    завершенные корутины. В формат JSON события переводятся только при вызове dump().
+
+    Когда трассировка включена, цикл run() отдает выполнение очереди готовых методу run_ready(). Чтение часов и
+    запись события на каждом шаге стоили бы долей микросекунды, а шаг задачи, которая только переключается между
+    сокетами и очередями, длится всего несколько микросекунд, то есть трассировка замедляла бы цикл на 20-30%.
+    Поэтому на каждом шаге уменьшается только счетчик, а время читается в начале и в конце всей пачки готовых функций
+    и вокруг каждого sample-го шага. Так стоимость трассировки остается в пределах нескольких процентов. Долгий шаг,
+    который задержал цикл, все равно виден: пачка, в которой он выполнялся, тоже долгая. Если нужно время каждого шага,
+    то Tracer(sample=1) записывает все шаги, но стоит дороже.
+
+    batch - пачка готовых функций, выполненных за одну итерацию цикла: сколько она длилась и сколько в ней было шагов.
+    step - каждый sample-й вызов готовой функции или шаг задачи (для задачи записывается имя корутины) и сколько он
+    длился.
+    select - сколько цикл ждал в select() и сколько сокетов оказалось готово к чтению и записи.
+    instant - мгновенные события: срабатывание таймера спящей задачи и пробуждение задачи очередью.
+
+    dump - сохраняет события в формате Chrome trace (trace event format). Файл можно открыть в https://ui.perfetto.dev
+    или в chrome://tracing и увидеть шаги задач на временной шкале.
+
+    bench - запускает одну и ту же нагрузку (эхо-обмен через пары сокетов) без трассировки и с ней, с выборкой
+    шагов и с записью всех шагов, и выводит, во сколько обходится трассировка.
+"""
@@ -0,0 +1,234 @@
+import time
+import types
+from collections import deque
+import heapq
+from select import select
+from socket import socketpair
+
+import io_scheduler
+
+# Trap kinds. A trap is a (kind, argument) tuple yielded by a coroutine to the kernel.
+YIELD = 0           # Go to the end of the ready queue
+SLEEP = 1           # Argument: delay in seconds
+READ_WAIT = 2       # Argument: socket or file descriptor
+WRITE_WAIT = 3
+WAIT = 4            # Argument: a deque the task parks in, whoever wakes it calls kernel.wake()
+
+
+class Kernel:
+    def __init__(self):
+        self.ready = deque()     # Coroutines ready to run
+        self.sleeping = []
+        self.sequence = 0
+        self._read_waiting = {}
+        self._write_waiting = {}
+
+    def new_task(self, coro):
+        self.ready.append(coro)
+
+    def wake(self, coro):
+        self.ready.append(coro)
+
+    def run(self):
+        ready = self.ready
+        while ready or self.sleeping or self._read_waiting or self._write_waiting:
+            if not ready:
+                timeout = None
+                if self.sleeping:
+                    timeout = max(self.sleeping[0][0] - time.time(), 0)
+                can_read, can_write, _ = select(self._read_waiting, self._write_waiting, [], timeout)
+                for fd in can_read:
+                    ready.append(self._read_waiting.pop(fd))
+                for fd in can_write:
+                    ready.append(self._write_waiting.pop(fd))
+                now = time.time()
+                while self.sleeping and now >= self.sleeping[0][0]:
+                    ready.append(heapq.heappop(self.sleeping)[2])
+
+            while ready:
+                coro = ready.popleft()
+                try:
+                    kind, arg = coro.send(None)
+                except StopIteration:
+                    continue
+                # The task is suspended exactly where the trap says, nothing else to check
+                if kind == READ_WAIT:
+                    self._read_waiting[arg] = coro
+                elif kind == WRITE_WAIT:
+                    self._write_waiting[arg] = coro
+                elif kind == WAIT:
+                    arg.append(coro)
+                elif kind == SLEEP:
+                    self.sequence += 1
+                    heapq.heappush(self.sleeping, (time.time() + arg, self.sequence, coro))
+                elif kind == YIELD:
+                    ready.append(coro)
+                else:
+                    coro.close()
+                    raise RuntimeError(f'Unknown trap {kind!r}')
+
+
+kernel = Kernel()
+
+
+# Blocking operations are plain generators, the trap is yielded straight to the kernel
+@types.coroutine
+def sleep(delay):
+    yield SLEEP, delay
+
+
+@types.coroutine
+def switch():
+    yield YIELD, None
+
+
+@types.coroutine
+def recv(sock, maxbytes):
+    yield READ_WAIT, sock
+    return sock.recv(maxbytes)
+
+
+@types.coroutine
+def send(sock, data):
+    yield WRITE_WAIT, sock
+    return sock.send(data)
+
+
+@types.coroutine
+def accept(sock):
+    yield READ_WAIT, sock
+    return sock.accept()
+
+
+class Queue:
+    def __init__(self):
+        self.items = deque()
+        self.waiting = deque()      # Getters parked with the WAIT trap
+
+    def put(self, item):
+        self.items.append(item)
+        if self.waiting:
+            kernel.wake(self.waiting.popleft())
+
+    @types.coroutine
+    def get(self):
+        while not self.items:
+            yield WAIT, self.waiting
+        return self.items.popleft()
+
+
+async def echo_handler(client):
+    while True:
+        data = await recv(client, 10000)
+        if not data:
+            break
+        await send(client, b'Got:' + data)
+    client.close()
+
+
+# The same workloads on both cores
+async def trap_ping(inbox, outbox, count):
+    for n in range(count):
+        outbox.put(n)
+        await inbox.get()
+
+
+async def trap_pong(inbox, outbox, count):
+    for _ in range(count):
+        outbox.put(await inbox.get())
+
+
+async def trap_client(sock, count):
+    for _ in range(count):
+        await send(sock, b'ping')
+        await recv(sock, 100)
+    sock.close()
+
+
+async def sched_ping(inbox, outbox, count):
+    for n in range(count):
+        await outbox.put(n)
+        await inbox.get()
+
+
+async def sched_pong(inbox, outbox, count):
+    for _ in range(count):
+        await outbox.put(await inbox.get())
+
+
+async def sched_client(sock, count):
+    sched = io_scheduler.sched
+    for _ in range(count):
+        await sched.send(sock, b'ping')
+        await sched.recv(sock, 100)
+    sock.close()
+
+
+async def sched_echo(client):
+    sched = io_scheduler.sched
+    while True:
+        data = await sched.recv(client, 10000)
+        if not data:
+            break
+        await sched.send(client, b'Got:' + data)
+    client.close()
+
+
+def _timed(loop):
+    start = time.perf_counter()
+    loop.run()
+    return time.perf_counter() - start
+
+
+def bench(count=100000, pairs=20, echoes=2000):
+    sched = io_scheduler.sched
+    results = {}
+    for name, loop, queue, ping, pong, client, handler in (
+            ('io_scheduler', sched, io_scheduler.AsyncQueue, sched_ping, sched_pong, sched_client, sched_echo),
+            ('trap kernel', kernel, Queue, trap_ping, trap_pong, trap_client, echo_handler)):
+        a, b = queue(), queue()
+        loop.new_task(ping(a, b, count))
+        loop.new_task(pong(b, a, count))
+        switches = _timed(loop)
+
+        for _ in range(pairs):
+            left, right = socketpair()
+            left.setblocking(False)
+            right.setblocking(False)
+            loop.new_task(client(left, echoes))
+            loop.new_task(handler(right))
+        echo = _timed(loop)
+        results[name] = (count * 2 / switches, pairs * echoes / echo)
+
+    for name, (switches, echo) in results.items():
+        print(f'{name:>12}: {switches:,.0f} queue handoffs/sec, {echo:,.0f} socket echoes/sec')
+
+
+if __name__ == '__main__':
+    bench()
+
+
+"""
+    Другое устройство ядра планировщика - на "ловушках" (trap), как в генераторах из generators/yield_from_2.py.
+
+    В io_scheduler каждая блокирующая операция (sleep, recv, send, accept, AsyncQueue.get) сама регистрирует текущую
+    задачу: кладет sched.current в очередь ожидания, присваивает sched.current = None и отдает управление через
+    await switch(). А Task.__call__ после каждого шага проверяет sched.current, чтобы понять, заснула задача или нет.
+    Если операция забудет обнулить sched.current, задача окажется сразу в двух очередях.
+
+    Здесь корутина вместо этого отдает ядру (yield) маленькую запись - кортеж (вид ловушки, аргумент):
+    (SLEEP, задержка), (READ_WAIT, сокет), (WRITE_WAIT, сокет), (WAIT, очередь ожидания) или (YIELD, None). Ядро получает
+    эту запись прямо как результат coro.send(None) и само кладет корутину куда нужно. Глобального sched.current нет
+    вообще: ядро и так знает, какую корутину оно только что выполняло. Задача не может оказаться в двух местах сразу,
+    а неизвестная ловушка сразу вызывает ошибку.
+
+    Блокирующие операции (sleep, recv, send, accept, Queue.get) - это обычные генераторы с декоратором
+    types.coroutine, поэтому их можно ждать через await, а ловушка без промежуточных объектов Awaitable уходит прямо
+    в ядро. После пробуждения генератор продолжает работу и выполняет саму операцию, например sock.recv().
+
+    Queue - очередь, где ждущий получатель паркуется ловушкой WAIT в очереди self.waiting, а put() будит его через
+    kernel.wake(). put() ничего не ждет, поэтому это обычная функция.
+
+    bench - одни и те же нагрузки на обоих ядрах: передача значений между двумя задачами через пару очередей и
+    эхо-обмен через пары сокетов.
+"""
@@ -0,0 +1,187 @@
+import os
+import stat
+import struct
+import time
+from socket import *
+
+from io_scheduler import sched, echo_handler, DatagramRing
+
+
+def _unix_socket(path, kind):
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        pass
+    else:
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError(f'{path} exists and is not a socket')    # Never delete someone's regular file
+        os.unlink(path)      # Stale socket file left by a previous run
+    sock = socket(AF_UNIX, kind)
+    sock.bind(path)
+    sock.setblocking(False)
+    return sock
+
+
+async def unix_server(path, handler=echo_handler, backlog=128, max_accept=64):
+    sock = _unix_socket(path, SOCK_STREAM)
+    sock.listen(backlog)
+    while True:
+        for client, _ in await sched.accept_many(sock, max_accept):
+            sched.new_task(handler(client))
+
+
+async def unix_connect(path):
+    sock = socket(AF_UNIX, SOCK_STREAM)
+    sock.setblocking(False)
+    await sched.connect(sock, path)
+    return sock
+
+
+async def unix_datagram_server(path):
+    sock = _unix_socket(path, SOCK_DGRAM)
+    ring = DatagramRing()
+    while True:
+        datagrams = await sched.recvfrom_many(sock, ring)
+        # Only clients that bound their own path can receive a reply
+        await sched.sendto_many(sock, [(b'Got:' + data, addr) for data, addr in datagrams if addr])
+
+
+def unix_datagram_client(path):
+    return _unix_socket(path, SOCK_DGRAM)     # Bound to its own path to receive replies
+
+
+class Channel:
+    header = struct.Struct('!I')    # Length prefix of every message
+
+    def __init__(self, sock):
+        sock.setblocking(False)
+        self.sock = sock
+        self.buffer = bytearray()
+
+    @classmethod
+    def pair(cls):
+        a, b = socketpair(AF_UNIX, SOCK_STREAM)
+        return cls(a), cls(b)
+
+    async def send(self, data):
+        view = memoryview(self.header.pack(len(data)) + data)
+        while view:
+            sent = await sched.send(self.sock, view)
+            view = view[sent:]
+
+    async def recv(self):
+        await self._fill(self.header.size)
+        size, = self.header.unpack_from(self.buffer)
+        await self._fill(self.header.size + size)
+        data = bytes(self.buffer[self.header.size:self.header.size + size])
+        del self.buffer[:self.header.size + size]
+        return data
+
+    async def _fill(self, size):
+        while len(self.buffer) < size:
+            data = await sched.recv(self.sock, 65536)
+            if not data:
+                raise EOFError('Channel closed')
+            self.buffer += data
+
+    def close(self):
+        self.sock.close()
+
+
+"""
+    Channel - двусторонний канал между родительским и дочерним процессом на основе socketpair(). Сообщения передаются
+    целиком: перед каждым сообщением отправляется его длина (4 байта), а recv() читает из сокета в буфер до тех пор,
+    пока там не окажется сообщение полностью. Если другая сторона закрыла канал, recv() выбрасывает EOFError.
+"""
+
+
+async def _worker(channel):
+    try:
+        while True:
+            data = await channel.recv()
+            await channel.send(data.upper())
+    except EOFError:
+        channel.close()
+
+
+async def _parent(channel, count):
+    for n in range(count):
+        await channel.send(b'job %d' % n)
+        print('Worker replied', await channel.recv())
+    channel.close()
+
+
+async def _bench_server(sock, clients):
+    for _ in range(clients):
+        client, _ = await sched.accept(sock)
+        sched.new_task(echo_handler(client))
+
+
+async def _bench_client(sock, addr, count, size, stats):
+    await sched.connect(sock, addr)
+    message = b'x' * size
+    reply = len(message) + len(b'Got:')
+    for _ in range(count):
+        await sched.send(sock, message)
+        received = 0
+        while received < reply:
+            received += len(await sched.recv(sock, 65536))
+    stats['messages'] += count
+    sock.close()
+
+
+def bench(clients=10, count=2000, size=1000, path='/tmp/mini_asyncio_bench.sock'):
+    for name, family, addr in [('tcp', AF_INET, ('127.0.0.1', 30002)), ('unix', AF_UNIX, path)]:
+        if family == AF_UNIX:
+            server = _unix_socket(path, SOCK_STREAM)
+        else:
+            server = socket(family, SOCK_STREAM)
+            server.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            server.bind(addr)
+        server.listen(clients)
+        stats = {'messages': 0}
+        sched.new_task(_bench_server(server, clients))
+        for _ in range(clients):
+            sock = socket(family, SOCK_STREAM)
+            sock.setblocking(False)
+            sched.new_task(_bench_client(sock, addr, count, size, stats))
+        start = time.perf_counter()
+        sched.run()
+        elapsed = time.perf_counter() - start
+        server.close()
+        print(f'{name:>4}: {stats["messages"] / elapsed:.0f} echo round-trips/sec')
+
+
+if __name__ == '__main__':
+    parent_channel, child_channel = Channel.pair()
+    if os.fork() == 0:
+        parent_channel.close()
+        sched.new_task(_worker(child_channel))
+        sched.run()
+        os._exit(0)
+
+    child_channel.close()
+    sched.new_task(_parent(parent_channel, 5))
+    sched.run()
+    os.wait()
+
+    bench()
+
+
+"""
+    Сервисы, работающие на одной машине, могут общаться не через TCP по адресу 127.0.0.1, а через сокеты домена
+    Unix (AF_UNIX). Адресом такого сокета является путь к файлу, а данные не проходят через сетевой стек TCP/IP:
+    нет подсчета контрольных сумм, подтверждений и управления перегрузкой, поэтому обмен данными быстрее.
+
+    unix_server - Тоже самое что и tcp_server из файла io_scheduler.py, только слушает Unix сокет. Перед созданием
+    сокета удаляет файл, оставшийся от прошлого запуска, иначе bind() выбросит ошибку. Удаляется только файл сокета
+    (проверка stat.S_ISSOCK) - если по этому пути лежит обычный файл или каталог, выбрасывается FileExistsError.
+
+    unix_connect - Создает неблокирующий Unix сокет и подключает его к серверу через sched.connect().
+
+    unix_datagram_server - Тоже самое что и udp_echo_server, только для Unix датаграмм. Ответить можно только тому
+    клиенту, чей сокет привязан к своему пути (unix_datagram_client), у остальных адрес пустой.
+
+    bench - Сравнивает скорость эхо-обмена через TCP на 127.0.0.1 и через Unix сокет. Несколько клиентов на том же
+    планировщике отправляют сообщения echo_handler и ждут ответа, после чего выводится число обменов в секунду.
+"""
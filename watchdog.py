@@ -0,0 +1,119 @@
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+
+from io_scheduler import sched, Task
+
+BUCKETS = [0.001 * 2 ** n for n in range(12)]    # 1 ms .. 2 s, plus one bucket for slower
+
+
+class Watchdog:
+    def __init__(self, threshold=0.1, interval=None):
+        self.threshold = threshold                 # Seconds a loop iteration may run without blocking
+        self.interval = interval or threshold / 2  # How often the thread checks the heartbeat
+        self.last = None            # Time of the last heartbeat, None while waiting in select()
+        self.histogram = [0] * (len(BUCKETS) + 1)
+        self.stalls = 0
+        self._reported = None       # Heartbeat that was already reported
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Called by the scheduler loop (main thread)
+    def beat(self):
+        now = time.perf_counter()
+        if self.last is not None:
+            self._record(now - self.last)
+        self.last = now
+
+    def idle(self):
+        if self.last is not None:
+            self._record(time.perf_counter() - self.last)
+        self.last = None
+
+    def _record(self, lag):
+        self.histogram[bisect_left(BUCKETS, lag)] += 1
+
+    # Watchdog thread
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        sched.watchdog = self
+
+    def stop(self):
+        sched.watchdog = None
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        main_id = threading.main_thread().ident
+        while not self._stop.wait(self.interval):
+            last = self.last
+            if last is None or last == self._reported:
+                continue
+            lag = time.perf_counter() - last
+            if lag > self.threshold:
+                self._reported = last       # One report per stall
+                self.stalls += 1
+                self.report(lag, sched.current, sys._current_frames().get(main_id))
+
+    def report(self, lag, task, frame):
+        if type(task) is Task:
+            who = f'task {task.coro.__qualname__} at {id(task):#x}'
+        else:
+            who = 'no task (scheduler or a callback)'
+        stack = ''.join(traceback.format_stack(frame)) if frame else ''
+        print(f'Loop blocked for {lag * 1000:.0f} ms in {who}\n{stack}', file=sys.stderr)
+
+    def summary(self):
+        lines = []
+        for n, count in enumerate(self.histogram):
+            if count:
+                bound = f'<= {BUCKETS[n] * 1000:g} ms' if n < len(BUCKETS) else f'> {BUCKETS[-1] * 1000:g} ms'
+                lines.append(f'{bound:>12}: {count}')
+        return '\n'.join(lines)
+
+
+def load_config():
+    time.sleep(0.5)         # A blocking call by mistake, the whole loop stops
+    return {}
+
+
+async def handler(n):
+    for _ in range(5):
+        await sched.sleep(0.1)
+        if n == 2:
+            load_config()
+
+
+if __name__ == '__main__':
+    watchdog = Watchdog(threshold=0.2)
+    watchdog.start()
+    for n in range(3):
+        sched.new_task(handler(n))
+    sched.run()
+    watchdog.stop()
+    print(f'Stalls: {watchdog.stalls}\nLoop lag:\n{watchdog.summary()}')
+
+
+"""
+    Watchdog - сторожевой поток, который замечает, что цикл планировщика завис. Если обработчик по ошибке вызывает
+    блокирующую функцию (time.sleep(), синхронный запрос к базе данных), то останавливаются все соединения, а сам
+    планировщик никак об этом не сообщает.
+
+    Планировщик на каждой итерации цикла вызывает beat() - отмечает время, а перед ожиданием в select() вызывает idle(),
+    потому что ждать событий в select() - нормально и задержкой не считается. idle() вызывается и при выходе из run():
+    иначе последняя итерация не попала бы в гистограмму, а блокирующий код, который выполняется между двумя вызовами
+    sched.run(), сторож принял бы за зависание цикла. Обе функции заодно записывают, сколько длилась работа с прошлой
+    отметки, в гистограмму задержек цикла (histogram): корзины по степеням двойки от 1 мс до 2 с. По ней удобно строить
+    оповещения: например, если заметная доля итераций дольше 64 мс.
+
+    Отдельный поток каждые interval секунд смотрит на время последней отметки. Если цикл работает без перерыва дольше
+    threshold, то поток берет стек главного потока через sys._current_frames() и текущую задачу sched.current и
+    выводит их в stderr. Так видно, какая задача и в какой строке заблокировала цикл. Об одном зависании сообщается
+    один раз. Чтобы вывести отчет по-другому (в журнал, в метрики), достаточно переопределить report().
+
+    Включается вызовом start(), который подключает сторожа к планировщику (sched.watchdog), выключается stop().
+"""